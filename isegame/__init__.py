@@ -2,13 +2,31 @@ from http.client import NOT_FOUND
 from hypercorn.config import Config
 from hypercorn.asyncio import serve
 import asyncio
-from quart_schema import QuartSchema
-from quart import Quart, jsonify, send_from_directory
+from quart import Quart, Response, abort, jsonify, request
 import os
 import argparse
+from functools import partial
+import logging
+import multiprocessing
+import multiprocessing.connection
+import shutil
+import signal
+import socket
+import tempfile
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Optional
+
+from .settings import load_settings, parser
+
+if TYPE_CHECKING:
+    from .static import StaticAssets
+
+logger = logging.getLogger(__name__)
+
+# Seconds a worker must have run for before dying to be restarted right away.
+RESTART_DELAY = 1
 
 app = Quart(__name__)
-QuartSchema(app, convert_casing=True)
 
 # Global error handler for all routes.
 @app.errorhandler(Exception)
@@ -19,43 +37,245 @@ def handle_error(error):
 
 __import__(f"{__name__}.routes")
 
-# Serve react app statically if this exists.
-if os.path.exists("isegame_ui/dist"):
-    @app.route("/<path:filename>")
-    async def serve_react(filename: str):
-        return await send_from_directory("isegame_ui/dist", filename)
+@app.route("/metrics")
+async def serve_metrics():
+    from .metrics import render
+    return Response(render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
-    @app.route("/")
-    async def serve_index():
-        return await send_from_directory("isegame_ui/dist", "index.html")
+# The built react app, served from memory with precompressed variants once loaded.
+_assets: Optional["asyncio.Future[Optional[StaticAssets]]"] = None
 
-    @app.errorhandler(NOT_FOUND)
-    async def not_found(_):
-        return await send_from_directory("isegame_ui/dist", "index.html")
+def load_assets(directory: str) -> None:
+    """Starts loading the built UI in a background thread, so compressing it doesn't hold up startup."""
+    global _assets
+    _assets = asyncio.ensure_future(asyncio.to_thread(_read_assets, directory))
 
-parser = argparse.ArgumentParser()
-parser.add_argument("--debug", action="store_true", help = "Run in debug mode")
-parser.add_argument("--sense", action="store_true", help = "Run using sense hat as controller")
-args = parser.parse_args()
+def _read_assets(directory: str) -> Optional["StaticAssets"]:
+    if not os.path.isdir(directory):
+        return None
+    from .static import StaticAssets
+    return StaticAssets(directory)
 
-# Start main application.
-async def main() -> None:
+async def static_assets() -> Optional["StaticAssets"]:
+    """The built UI, or None if there is none, waiting for it to finish loading on the first requests."""
+    if _assets is None:
+        load_assets(app.config["STATIC_DIR"])
+    # Shielded since every early request waits on the same load.
+    return await asyncio.shield(_assets)
+
+@app.route("/<path:filename>")
+async def serve_react(filename: str):
+    assets = await static_assets()
+    asset = assets.get(filename) if assets is not None else None
+    if asset is None:
+        abort(NOT_FOUND)
+    return asset.respond(request)
+
+@app.route("/")
+async def serve_index():
+    assets = await static_assets()
+    if assets is None:
+        abort(NOT_FOUND)
+    return assets.get("index.html").respond(request)
+
+@app.errorhandler(NOT_FOUND)
+async def not_found(error):
+    assets = await static_assets()
+    if assets is None:
+        response = jsonify({"message": str(error)})
+        response.status_code = NOT_FOUND
+        return response
+    # Unknown paths are client side routes of the single page app.
+    return assets.get("index.html").respond(request)
+
+from .cluster import cluster
+from .rooms import normalize_code, rooms
+
+def configure(args: argparse.Namespace) -> None:
+    """Applies parsed command line arguments to the app."""
+    app.config["SEND_QUEUE_SIZE"] = args.send_queue_size
+    app.config["SEND_QUEUE_POLICY"] = args.send_queue_policy
+    app.config["CLIENT_RATE"] = args.client_rate
+    app.config["CLIENT_BURST"] = args.client_burst
+    app.config["STATIC_DIR"] = args.static_dir
+    app.config["CONTROL_TOKEN"] = args.control_token
+    rooms.answer_rate = args.room_answer_rate
+    rooms.answer_burst = args.room_answer_rate * 2
+    rooms.state_interval = args.state_interval / 1000
+    rooms.spectator_interval = args.spectator_interval / 1000
+    rooms.spectator_top = args.spectator_top
+    rooms.round_length = args.round_length
+    rooms.resume_grace = args.resume_grace
+
+# Defaults so the app also works when imported without going through `run`.
+configure(parser.parse_args([]))
+
+def server_config(args: argparse.Namespace, listener: Optional[socket.socket] = None) -> Config:
+    """Hypercorn settings for the parsed arguments."""
     config = Config()
-    config.accesslog = "-"
-    config.bind = ["0.0.0.0:3000"]
+    config.bind = [f"fd://{listener.fileno()}"] if listener is not None else [args.bind]
+    config.keep_alive_timeout = args.keep_alive
+    config.websocket_ping_interval = args.ws_ping_interval
+    config.websocket_max_message_size = args.ws_max_message_size
+    config.accesslog = None if args.access_log == "off" else args.access_log
+
+    from .accesslog import AccessLogger
+    config.logger_class = partial(AccessLogger, sample=args.access_log_sample, buffer=args.access_log_buffer)
+    return config
+
+def loop_factory(name: str) -> Optional[Callable[[], asyncio.AbstractEventLoop]]:
+    """Event loop constructor for `--loop`, None for the default asyncio loop."""
+    if name == "asyncio":
+        return None
+
+    try:
+        import uvloop
+    except ImportError:
+        if name == "uvloop":
+            parser.error("--loop uvloop requires the uvloop package")
+        return None
+    return uvloop.new_event_loop
+
+# Start main application.
+async def main(args: argparse.Namespace, listener: Optional[socket.socket] = None) -> None:
+    config = server_config(args, listener)
 
     loop = asyncio.get_event_loop()
 
-    if args.sense:
-        from .sense import sense_interface
-        loop.create_task(sense_interface())
+    # Set by signals or the debug GUI, lets the server drain and the cleanup below run.
+    shutdown = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, shutdown.set)
+        except NotImplementedError:
+            # Windows, Ctrl+C interrupts the runner instead.
+            pass
+
+    if args.openapi:
+        # Only the docs need it and it is slow to import, the Pi is better off without it.
+        from quart_schema import QuartSchema
+        QuartSchema(app, convert_casing=True)
+
+    # Compressed in the background while the server is already accepting connections.
+    load_assets(args.static_dir)
+
+    if cluster.size > 1:
+        from .routes import handle_peer
+        await cluster.serve(handle_peer)
+
+    if args.journal:
+        from .journal import Journal
+        rooms.journal = Journal(args.journal, snapshot_every=args.snapshot_every)
+        for game in rooms.recover(cluster.owns):
+            logger.warning("Recovered room %s from the journal", game.code)
+
+    # Local controllers live in the worker owning their room.
+    if cluster.owns(normalize_code(args.room)):
+        game = rooms.pin(args.room)
+
+        if args.sense:
+            from .sense import sense_interface
+            sense_interface(game)
+
+        if args.debug:
+            from . import ui
+            ui.DebugGui(loop, game, shutdown)
 
-    if args.debug:
-        from . import ui
-        ui.DebugGui(loop)
+    profiler = None
+    if args.profile:
+        from .profiler import Profiler
+        output = args.profile_output
+        if output and cluster.size > 1:
+            output = f"{output}.{cluster.index}"
+        profiler = Profiler(args.profile_threshold / 1000, output)
+        profiler.start()
 
-    await serve(app, config)
+    try:
+        await serve(app, config, shutdown_trigger=shutdown.wait)
+    finally:
+        cluster.close()
+        if rooms.journal is not None:
+            rooms.journal.close()
+        if profiler is not None:
+            profiler.stop()
+        config.log.flush()
+
+def run_worker(args: argparse.Namespace, index: int, socket_dir: str, listener: socket.socket) -> None:
+    """Entry point of a worker process forked by `run`."""
+    cluster.index = index
+    cluster.size = args.workers
+    cluster.socket_dir = socket_dir
+    # The supervisor's handler is inherited through fork, the worker shuts down on its own instead.
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    with asyncio.Runner(loop_factory=loop_factory(args.loop)) as runner:
+        runner.run(main(args, listener))
 
 # Exists for task
 def run() -> None:
-    asyncio.run(main())
\ No newline at end of file
+    args = load_settings()
+    configure(args)
+    # Resolved up front so a missing uvloop is reported before any worker starts.
+    factory = loop_factory(args.loop)
+    if args.workers <= 1:
+        with asyncio.Runner(loop_factory=factory) as runner:
+            runner.run(main(args))
+        return
+
+    # Workers are forked before any loop exists and all accept on the same listening socket.
+    host, _, port = args.bind.rpartition(":")
+    listener = socket.create_server((host.strip("[]"), int(port)), backlog=1024)
+    listener.set_inheritable(True)
+    socket_dir = tempfile.mkdtemp(prefix="isegame-")
+    context = multiprocessing.get_context("fork")
+
+    def start(index: int) -> multiprocessing.Process:
+        worker = context.Process(target=run_worker, args=(args, index, socket_dir, listener), name=f"isegame-worker-{index}")
+        worker.start()
+        started[index] = time.monotonic()
+        return worker
+
+    workers: Dict[int, multiprocessing.Process] = {}
+    started: Dict[int, float] = {}
+    # Terminating the supervisor stops the workers with it instead of orphaning them.
+    signal.signal(signal.SIGTERM, _interrupt)
+    try:
+        for index in range(args.workers):
+            workers[index] = start(index)
+        supervise(workers, start, started)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for worker in workers.values():
+            worker.terminate()
+        for worker in workers.values():
+            worker.join()
+        listener.close()
+        shutil.rmtree(socket_dir, ignore_errors=True)
+
+def supervise(
+    workers: Dict[int, multiprocessing.Process],
+    start: Callable[[int], multiprocessing.Process],
+    started: Dict[int, float]
+) -> None:
+    """Restarts workers that die, a worker exiting cleanly means the server was asked to stop.
+
+    A restarted worker takes over the same rooms, clients of those rooms reconnect and resume.
+    Workers dying right after starting are restarted with a delay so a broken setup doesn't spin.
+    """
+    while True:
+        multiprocessing.connection.wait([worker.sentinel for worker in workers.values()])
+        for index, worker in list(workers.items()):
+            if worker.is_alive():
+                continue
+            worker.join()
+            if worker.exitcode == 0:
+                logger.warning("Worker %d stopped, shutting down", index)
+                return
+
+            logger.warning("Worker %d exited with code %s, restarting it", index, worker.exitcode)
+            if time.monotonic() - started[index] < RESTART_DELAY:
+                time.sleep(RESTART_DELAY)
+            workers[index] = start(index)
+
+def _interrupt(signum, frame) -> None:
+    raise KeyboardInterrupt
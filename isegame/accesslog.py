@@ -0,0 +1,57 @@
+from logging import ERROR, LogRecord
+from logging.handlers import MemoryHandler
+import random
+from typing import TYPE_CHECKING, Optional
+
+from hypercorn.config import Config
+from hypercorn.logging import Logger
+
+from .scheduler import Timer, wheel
+
+if TYPE_CHECKING:
+    from hypercorn.typing import ResponseSummary, WWWScope
+
+
+class BufferedHandler(MemoryHandler):
+    """Collects log lines and writes them in batches, once `capacity` lines have built up or the oldest is `max_age` seconds old.
+
+    Only used from the event loop, the age limit is enforced by the shared timer wheel.
+    """
+
+    def __init__(self, capacity: int, target, max_age: float = 1):
+        super().__init__(capacity, ERROR, target, flushOnClose=True)
+        self.max_age = max_age
+        self._flush_handle: Optional[Timer] = None
+
+    def emit(self, record: LogRecord) -> None:
+        super().emit(record)
+        if self.buffer and self._flush_handle is None:
+            self._flush_handle = wheel.call_later(self.max_age, self._flush_aged)
+
+    def _flush_aged(self) -> None:
+        self._flush_handle = None
+        self.flush()
+
+class AccessLogger(Logger):
+    """Hypercorn logger writing a sample of requests to the access log through a buffer.
+
+    Skipped requests are dropped before their log line is formatted, and buffered lines are written
+    in batches, so access logging stays cheap under load.
+    """
+
+    def __init__(self, config: Config, sample: float = 1, buffer: int = 0):
+        super().__init__(config)
+        self.sample = sample
+        if self.access_logger is not None and buffer > 0:
+            self.access_logger.handlers = [BufferedHandler(buffer, handler) for handler in self.access_logger.handlers]
+
+    async def access(self, request: "WWWScope", response: "ResponseSummary", request_time: float) -> None:
+        if self.sample < 1 and random.random() >= self.sample:
+            return
+        await super().access(request, response, request_time)
+
+    def flush(self) -> None:
+        """Writes out anything still buffered, worker processes exit without running logging's own shutdown."""
+        if self.access_logger is not None:
+            for handler in self.access_logger.handlers:
+                handler.flush()
@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+from collections import deque
+from contextlib import AsyncExitStack
+import json
+import random
+import sys
+import time
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from wsproto import ConnectionType, WSConnection
+from wsproto.events import AcceptConnection, CloseConnection, Ping, RejectConnection, Request, TextMessage
+
+# Load generator simulating many players against the websocket protocol in `routes.ws`.
+# Runs the app in-process by default, or against a running server with `--url`.
+
+
+class RemoteSocket:
+    """Minimal websocket client speaking to a running server, built on wsproto."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, connection: WSConnection):
+        self.reader = reader
+        self.writer = writer
+        self.connection = connection
+        self._events: Deque[Any] = deque()
+        self._buffer: List[str] = []
+
+    @classmethod
+    async def connect(cls, url: str) -> "RemoteSocket":
+        parts = urlsplit(url)
+        reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+        connection = WSConnection(ConnectionType.CLIENT)
+        writer.write(connection.send(Request(host=parts.netloc, target=parts.path or "/")))
+        await writer.drain()
+
+        socket = cls(reader, writer, connection)
+        while True:
+            event = await socket._next_event()
+            if isinstance(event, AcceptConnection):
+                return socket
+            if isinstance(event, RejectConnection):
+                raise ConnectionError(f"Websocket rejected with status {event.status_code}")
+
+    async def _next_event(self) -> Any:
+        while not self._events:
+            data = await self.reader.read(65536)
+            if not data:
+                raise ConnectionError("Connection closed")
+            self.connection.receive_data(data)
+            self._events.extend(self.connection.events())
+
+        return self._events.popleft()
+
+    async def send_json(self, message: Any) -> None:
+        self.writer.write(self.connection.send(TextMessage(data=json.dumps(message))))
+        await self.writer.drain()
+
+    async def receive_json(self) -> Any:
+        while True:
+            event = await self._next_event()
+            if isinstance(event, TextMessage):
+                self._buffer.append(event.data)
+                if event.message_finished:
+                    data = "".join(self._buffer)
+                    self._buffer.clear()
+                    return json.loads(data)
+            elif isinstance(event, Ping):
+                self.writer.write(self.connection.send(event.response()))
+            elif isinstance(event, CloseConnection):
+                raise ConnectionError("Connection closed")
+
+    async def close(self) -> None:
+        self.writer.close()
+
+
+class Controller:
+    """Starts rounds in the rooms being benchmarked."""
+
+    async def start(self, room: str) -> None:
+        raise NotImplementedError
+
+class LocalController(Controller):
+    async def start(self, room: str) -> None:
+        from .rooms import rooms
+        game = rooms.get(room)
+        if game is not None:
+            await game.start_game()
+
+class RemoteController(Controller):
+    def __init__(self, url: str, token: Optional[str] = None):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.token = token
+
+    async def start(self, room: str) -> None:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        authorization = f"Authorization: Bearer {self.token}\r\n" if self.token else ""
+        writer.write(
+            f"POST /rooms/{room}/start HTTP/1.1\r\nHost: {self.host}\r\n{authorization}Content-Length: 0\r\nConnection: close\r\n\r\n".encode()
+        )
+        await writer.drain()
+        await reader.read()
+        writer.close()
+
+
+class Stats:
+    """Measurements collected by all simulated clients."""
+
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.errors = 0
+        self.answers = 0
+        self.latencies: List[float] = []
+        # First and last receive time of every broadcast state version per room.
+        self.broadcasts: Dict[Tuple[str, int], List[float]] = {}
+
+    def record_broadcast(self, room: str, version: int, now: float) -> None:
+        times = self.broadcasts.get((room, version))
+        if times is None:
+            self.broadcasts[(room, version)] = [now, now]
+        else:
+            times[1] = now
+
+def percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    """Nearest rank percentiles of samples in seconds, reported in milliseconds."""
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+
+    ordered = sorted(samples)
+    def rank(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 3)
+
+    return {"p50": rank(0.50), "p95": rank(0.95), "p99": rank(0.99), "max": round(ordered[-1] * 1000, 3)}
+
+
+async def simulate(
+    idx: int,
+    socket: Any,
+    room: str,
+    piece: int,
+    rate: float,
+    deadline: float,
+    stats: Stats,
+    controller: Controller
+) -> None:
+    """Plays as a single client until the deadline."""
+    answer_sent: Optional[float] = None
+    answer_task: Optional[asyncio.Task] = None
+
+    async def answer_later(question: Dict[str, Any]) -> None:
+        nonlocal answer_sent
+        # Poisson arrivals so clients don't answer in lockstep.
+        await asyncio.sleep(random.expovariate(rate))
+        answer_sent = time.perf_counter()
+        stats.sent += 1
+        await socket.send_json({"action": "answer", "answer": random.randrange(len(question["options"]))})
+
+    await socket.send_json({"action": "join", "name": f"bot{idx}", "piece": piece, "room": room})
+    stats.sent += 1
+
+    try:
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return
+
+            try:
+                message = await asyncio.wait_for(socket.receive_json(), remaining)
+            except asyncio.TimeoutError:
+                return
+
+            now = time.perf_counter()
+            stats.received += 1
+            action = message["action"]
+
+            if action in ("question", "answer"):
+                if action == "answer" and answer_sent is not None:
+                    stats.answers += 1
+                    stats.latencies.append(now - answer_sent)
+                    answer_sent = None
+                answer_task = asyncio.create_task(answer_later(message["question"]))
+            elif action in ("state", "delta"):
+                stats.record_broadcast(room, message["version"], now)
+                # First player of the room restarts rounds as they end to keep load steady.
+                if action == "state" and piece == 0 and message["state"]["status"] == "paused":
+                    asyncio.create_task(controller.start(room))
+            elif action == "error":
+                stats.errors += 1
+    finally:
+        if answer_task is not None:
+            answer_task.cancel()
+
+
+async def benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    stats = Stats()
+    room_codes = [f"bench-{i}" for i in range(args.rooms)]
+
+    async with AsyncExitStack() as stack:
+        if args.url:
+            controller: Controller = RemoteController(args.url, args.control_token)
+            async def connect() -> Any:
+                socket = await RemoteSocket.connect(args.url)
+                stack.push_async_callback(socket.close)
+                return socket
+        else:
+            from . import app
+            from .rooms import rooms
+            rooms.state_interval = args.state_interval / 1000
+            controller = LocalController()
+            client = app.test_client()
+            async def connect() -> Any:
+                return await stack.enter_async_context(client.websocket("/ws"))
+
+        sockets = [await connect() for _ in range(args.clients)]
+
+        # Every client joins before the clock starts.
+        deadline = time.perf_counter() + args.duration + args.warmup
+        tasks = [
+            asyncio.create_task(simulate(
+                idx, socket, room_codes[idx % args.rooms], idx // args.rooms, args.rate, deadline, stats, controller
+            ))
+            for idx, socket in enumerate(sockets)
+        ]
+        await asyncio.sleep(args.warmup)
+
+        for room in room_codes:
+            await controller.start(room)
+
+        started = time.perf_counter()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    skews = [last - first for first, last in stats.broadcasts.values()]
+    return {
+        "config": {
+            "target": args.url or "in-process",
+            "clients": args.clients,
+            "rooms": args.rooms,
+            "rate": args.rate,
+            "duration": args.duration,
+        },
+        "answers": stats.answers,
+        "errors": stats.errors,
+        "answer_latency_ms": percentiles(stats.latencies),
+        "broadcast_skew_ms": percentiles(skews),
+        "messages_per_second": {
+            "sent": round(stats.sent / elapsed, 1),
+            "received": round(stats.received / elapsed, 1),
+        },
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Websocket load and latency benchmark")
+    parser.add_argument("--url", help = "Websocket URL of a running server, e.g. ws://localhost:3000/ws (default: in-process)")
+    parser.add_argument("--clients", type=int, default=100, help = "Number of simulated players")
+    parser.add_argument("--rooms", type=int, default=4, help = "Number of rooms players are spread over")
+    parser.add_argument("--rate", type=float, default=1, help = "Answers per second per player")
+    parser.add_argument("--duration", type=float, default=20, help = "Seconds to measure for")
+    parser.add_argument("--warmup", type=float, default=1, help = "Seconds to wait after joining before starting rounds")
+    parser.add_argument("--state-interval", type=int, default=100, help = "State tick in milliseconds for in-process runs")
+    parser.add_argument("--control-token", help = "Control token of the server under test, if it requires one")
+    parser.add_argument("--output", help = "Write results to this file instead of stdout")
+    args = parser.parse_args()
+
+    result = asyncio.run(benchmark(args))
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import os
+import struct
+from typing import Any, Awaitable, Callable, Dict, Optional
+import zlib
+
+from .protocol import Frame
+
+# Kind byte of bus frames, a text frame is encoded utf-8.
+_TEXT = 0
+_BINARY = 1
+# Sent by the owner of a relayed client that asked for a room of another worker, JSON encoded.
+_REDIRECT = 2
+_HEADER = struct.Struct("!BI")
+
+
+class Redirect(Exception):
+    """Raised when receiving from a peer that handed its relayed client back to be routed again."""
+    def __init__(self, code: str, message: Any):
+        self.code = code
+        # Client message naming the room, to be replayed to its owner.
+        self.message = message
+
+class PeerSocket:
+    """Framed stream over a worker's unix socket, looks like a websocket to the game code.
+
+    Carries the frames of a client connected to another worker, or a control request, in both
+    directions. Every frame is prefixed with its kind and length.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    async def send(self, frame: Frame) -> None:
+        if isinstance(frame, str):
+            data, kind = frame.encode(), _TEXT
+        else:
+            data, kind = frame, _BINARY
+        self.writer.write(_HEADER.pack(kind, len(data)) + data)
+        await self.writer.drain()
+
+    async def receive(self) -> Frame:
+        """Reads the next frame, raises `asyncio.IncompleteReadError` once the peer went away.
+
+        Raises `Redirect` if the peer handed the client back.
+        """
+        kind, length = _HEADER.unpack(await self.reader.readexactly(_HEADER.size))
+        data = await self.reader.readexactly(length)
+        if kind == _REDIRECT:
+            redirect = json.loads(data)
+            raise Redirect(redirect["code"], redirect["message"])
+        return data.decode() if kind == _TEXT else data
+
+    async def redirect(self, code: str, message: Any) -> None:
+        """Hands a relayed client back to the worker it connected to, to be routed to the owner of `code`."""
+        data = json.dumps({"code": code, "message": message}).encode()
+        self.writer.write(_HEADER.pack(_REDIRECT, len(data)) + data)
+        await self.writer.drain()
+
+    async def send_json(self, message: Any) -> None:
+        await self.send(json.dumps(message))
+
+    async def receive_json(self) -> Any:
+        return json.loads(await self.receive())
+
+    def close(self) -> None:
+        self.writer.close()
+
+class Cluster:
+    """Worker processes of the server and which of them owns each room.
+
+    Rooms are pinned to a worker by a hash of their code. Each worker listens on a unix socket in a
+    shared directory, other workers open a stream to it to relay clients that joined one of its rooms
+    and to forward start and stop requests. A single worker owns every room and never uses the bus.
+    """
+
+    def __init__(self, index: int = 0, size: int = 1, socket_dir: Optional[str] = None):
+        self.index = index
+        self.size = size
+        self.socket_dir = socket_dir
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def owner(self, code: str) -> int:
+        """Index of the worker owning a normalized room code, stable across processes."""
+        return zlib.crc32(code.encode()) % self.size
+
+    def owns(self, code: str) -> bool:
+        return self.size == 1 or self.owner(code) == self.index
+
+    def path(self, index: int) -> str:
+        return os.path.join(self.socket_dir, f"worker-{index}.sock")
+
+    async def serve(self, handler: Callable[[PeerSocket], Awaitable[None]]) -> None:
+        """Accepts streams from other workers, each is passed to the handler."""
+        async def accept(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            peer = PeerSocket(reader, writer)
+            try:
+                await handler(peer)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                # Other side hung up, the handler already cleaned up after itself.
+                pass
+            except asyncio.CancelledError:
+                # Dropping a relayed client cancels its handler, asyncio logs cancelled stream callbacks as errors.
+                pass
+            finally:
+                peer.close()
+
+        self._server = await asyncio.start_unix_server(accept, self.path(self.index))
+
+    async def connect(self, code: str, header: Dict[str, Any]) -> PeerSocket:
+        """Opens a stream to the worker owning a room, starting with a header describing its use."""
+        reader, writer = await asyncio.open_unix_connection(self.path(self.owner(code)))
+        peer = PeerSocket(reader, writer)
+        await peer.send_json(header)
+        return peer
+
+    async def request(self, code: str, header: Dict[str, Any]) -> Dict[str, Any]:
+        """Sends a single request to the worker owning a room and waits for its reply."""
+        peer = await self.connect(code, header)
+        try:
+            return await peer.receive_json()
+        finally:
+            peer.close()
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+
+# Set up by `run` in each worker process, a single worker by default.
+cluster = Cluster()
@@ -0,0 +1,135 @@
+import asyncio
+from collections import deque
+from enum import Enum
+from typing import Any, Deque, Optional, Tuple, Union
+from quart import Websocket
+
+from . import metrics
+from .cluster import PeerSocket
+from .protocol import JSON, Frame, Handles, Protocol
+
+class OverflowPolicy(Enum):
+    """What a connection does when its outbound queue is full."""
+    # Drop the oldest non-critical (timer/state) frame to make space.
+    DROP_OLDEST = "drop_oldest"
+    # Replace an older queued frame of the same kind, state and timer frames supersede each other.
+    COALESCE = "coalesce"
+    # Give up on the client entirely.
+    DISCONNECT = "disconnect"
+
+class FrameKind(Enum):
+    """Classifies outbound frames so the queue knows which ones may be discarded."""
+    CRITICAL = "critical"
+    STATE = "state"
+    TIMER = "timer"
+
+class Connection:
+    """Websocket wrapper with a bounded outbound queue drained by its own writer task.
+
+    Sending never blocks the caller, so one slow client cannot stall broadcasts to everyone else.
+    """
+    # A client relayed from another worker arrives on a peer socket instead.
+    websocket: Union[Websocket, PeerSocket]
+    max_queue: int
+    policy: OverflowPolicy
+    # Frames with the room sequence number of broadcasts, 0 for frames sent to this connection only.
+    queue: Deque[Tuple[FrameKind, Frame, int]]
+    closed: bool
+    # Sequence number of the last broadcast handed to the socket, where a resumed session picks up.
+    sent_seq: int
+    protocol: Protocol
+    # Player handles of the room the connection is in, shared with the game.
+    handles: Handles
+
+    def __init__(
+        self,
+        websocket: Union[Websocket, PeerSocket],
+        max_queue: int = 64,
+        policy: OverflowPolicy = OverflowPolicy.COALESCE,
+        protocol: Protocol = JSON
+    ):
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.policy = policy
+        self.protocol = protocol
+        self.handles = {}
+        self.queue = deque()
+        self.closed = False
+        self.sent_seq = 0
+        self._wakeup = asyncio.Event()
+        self._writer_task: Optional[asyncio.Task] = None
+        # The handler task reading from this websocket, cancelled to disconnect the client.
+        self._handler_task = asyncio.current_task()
+
+    def start(self) -> None:
+        """Starts the writer task draining the queue."""
+        self._writer_task = asyncio.create_task(self._writer())
+
+    def send(self, frame: Frame, kind: FrameKind = FrameKind.CRITICAL, seq: int = 0) -> bool:
+        """Queues an already encoded frame without blocking, returns whether it was queued."""
+        if self.closed:
+            return False
+
+        if len(self.queue) >= self.max_queue and not self._make_room(kind):
+            metrics.overflow_disconnects.inc()
+            self.disconnect()
+            return False
+
+        self.queue.append((kind, frame, seq))
+        self._wakeup.set()
+        return True
+
+    def send_json(self, message: Any, kind: FrameKind = FrameKind.CRITICAL) -> bool:
+        """Encodes and queues a message meant only for this connection."""
+        return self.send(self.protocol.encode(message, self.handles), kind)
+
+    def _make_room(self, kind: FrameKind) -> bool:
+        """Applies the overflow policy, returns False if no space could be freed."""
+        if self.policy == OverflowPolicy.DISCONNECT:
+            return False
+
+        if self.policy == OverflowPolicy.COALESCE and kind != FrameKind.CRITICAL:
+            if self._discard_oldest((kind,)):
+                return True
+
+        # Timer ticks are the cheapest thing to lose, stale state frames are next.
+        return self._discard_oldest((FrameKind.TIMER,)) or self._discard_oldest((FrameKind.STATE,))
+
+    def _discard_oldest(self, kinds: Tuple[FrameKind, ...]) -> bool:
+        for idx, (kind, _, _) in enumerate(self.queue):
+            if kind in kinds:
+                del self.queue[idx]
+                metrics.dropped_frames.inc()
+                return True
+        return False
+
+    async def _writer(self) -> None:
+        try:
+            while not self.closed:
+                if not self.queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+
+                _, frame, seq = self.queue.popleft()
+                await self.websocket.send(frame)
+                if seq:
+                    self.sent_seq = seq
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Socket is unusable, drop the client rather than leaving it half alive.
+            self.disconnect()
+
+    def disconnect(self) -> None:
+        """Drops the client, the handler's cleanup will remove it from the game."""
+        self.close()
+        if self._handler_task is not None:
+            self._handler_task.cancel()
+
+    def close(self) -> None:
+        """Stops the writer and discards anything still queued."""
+        self.closed = True
+        self.queue.clear()
+        if self._writer_task is not None and self._writer_task is not asyncio.current_task():
+            self._writer_task.cancel()
@@ -1,11 +1,23 @@
-import asyncio
-from dataclasses import dataclass, field
+from collections import deque
+from dataclasses import astuple, dataclass, field
 from enum import Enum
-from random import randint, shuffle
+import secrets
 import time
-from typing import List, NamedTuple, Optional, Dict
+from typing import TYPE_CHECKING, Any, Callable, Deque, Iterable, Iterator, List, NamedTuple, Optional, Dict, Set, Tuple
 import uuid
-from quart import Websocket
+
+from . import metrics
+from .connection import Connection, FrameKind
+from .leaderboard import Leaderboard
+from .protocol import Frame, Handles, Protocol, frame_size
+from .publisher import StatePublisher
+from .questions import DEFAULT_TIER, Question, QuestionBank, Skill
+from .ratelimit import TokenBucket
+from .scheduler import Timer, wheel
+from .spectators import SpectatorStream
+
+if TYPE_CHECKING:
+    from .journal import Journal
 
 
 class ActionError(Exception):
@@ -19,52 +31,80 @@ class ActionResult(NamedTuple):
     message: str
     status_code: int
 
-@dataclass
-class Question:
-    """Represents a question in the game."""
-    question: str
-    options: List[int]
-    correct_answer: int
-    timestamp: float
-
-    def calculate_score(self):
-        # Assumes that the score is higher the quicker the response
-        time_elapsed = time.time() - self.timestamp
-        return max(0, 10 - int(time_elapsed))  # Example scoring formula
-
-    def to_dict(self):
-        return {"question": self.question, "options": self.options}
-
-    @classmethod
-    def generate(cls):
-        num1 = randint(1, 10)
-        num2 = randint(1, 10)
-        operation = randint(1, 3)  # 1: Addition, 2: Subtraction, 3: Multiplication
-        if operation == 1:
-            correct_answer = num1 + num2
-            question = f"{num1} + {num2}"
-        elif operation == 2:
-            correct_answer = num1 - num2
-            question = f"{num1} - {num2}"
-        else:
-            correct_answer = num1 * num2
-            question = f"{num1} * {num2}"
-        
-        options = [correct_answer, correct_answer + randint(1, 4), correct_answer - randint(1, 4), correct_answer * randint(2, 3)]
-        shuffle(options)
-        
-        return cls(question=question, options=options, correct_answer=correct_answer, timestamp=time.time())
-
-@dataclass
+@dataclass(slots=True)
 class User:
     """Represents a user within the game."""
     id: uuid.UUID
     name: str
     piece: int
-    connection: Websocket
+    # None while disconnected and waiting to resume.
+    connection: Optional[Connection]
+    # Small integer standing in for the id on binary frames, unique within the room.
+    handle: int = 0
+    # Secret the client presents to resume the session after a disconnect.
+    token: str = field(default_factory=lambda: secrets.token_urlsafe(16))
+    # Removes the user once the resume grace window runs out.
+    expiry: Optional[Timer] = None
+    # Last broadcast the user's previous connection got, replay starts after it.
+    resume_seq: int = 0
 
     def to_dict(self):
-        return {"id": str(self.id), "name": self.name, "piece": self.piece}
+        return {"id": str(self.id), "name": self.name, "piece": self.piece, "handle": self.handle}
+
+class UserRegistry:
+    """Users of a game indexed by id, connection, piece and resume token for constant time lookups."""
+    __slots__ = ("_by_id", "_by_connection", "_by_piece", "_by_token")
+
+    _by_id: Dict[uuid.UUID, User]
+    _by_connection: Dict[Connection, User]
+    _by_piece: Dict[int, User]
+    _by_token: Dict[str, User]
+
+    def __init__(self):
+        self._by_id = {}
+        self._by_connection = {}
+        self._by_piece = {}
+        self._by_token = {}
+
+    def add(self, user: User) -> None:
+        self._by_id[user.id] = user
+        if user.connection is not None:
+            self._by_connection[user.connection] = user
+        self._by_piece[user.piece] = user
+        self._by_token[user.token] = user
+
+    def remove(self, user: User) -> None:
+        self._by_id.pop(user.id, None)
+        self._by_connection.pop(user.connection, None)
+        self._by_token.pop(user.token, None)
+        if self._by_piece.get(user.piece) is user:
+            del self._by_piece[user.piece]
+
+    def attach(self, user: User, connection: Optional[Connection]) -> None:
+        """Moves a user to another connection, or to none while they are away."""
+        self._by_connection.pop(user.connection, None)
+        user.connection = connection
+        if connection is not None:
+            self._by_connection[connection] = user
+
+    def by_token(self, token: str) -> Optional[User]:
+        return self._by_token.get(token)
+
+    def get(self, user_id: uuid.UUID) -> Optional[User]:
+        return self._by_id.get(user_id)
+
+    def by_connection(self, connection: Connection) -> Optional[User]:
+        return self._by_connection.get(connection)
+
+    def piece_taken(self, piece: int) -> bool:
+        return piece in self._by_piece
+
+    def __iter__(self) -> Iterator[User]:
+        # Join order, dicts keep insertion order.
+        return iter(self._by_id.values())
+
+    def __len__(self) -> int:
+        return len(self._by_id)
 
 class GameStatus(Enum):
     ROUND = "round"
@@ -77,51 +117,108 @@ class GameState:
     scores: Dict[uuid.UUID, int] = field(default_factory=dict)
     questions: Dict[uuid.UUID, Question] = field(default_factory=dict)
     start_time: float = field(default=0)
+    # Wall clock time the current or last round started.
+    round_started: float = field(default=0)
     status: GameStatus = field(default=GameStatus.PAUSED)
+    # Users whose score changed or was removed since the last published state version.
+    changed: Set[uuid.UUID] = field(default_factory=set)
+    bank: QuestionBank = field(default_factory=QuestionBank)
+    skills: Dict[uuid.UUID, Skill] = field(default_factory=dict)
     
-    def to_dict(self):
-        move_spaces = None
+    # Moves of the last finished round, only set while paused.
+    move_spaces: Optional[Dict[uuid.UUID, int]] = None
+    leaderboard: Leaderboard = field(default_factory=Leaderboard)
+    # Bumped on every change to what `to_dict` returns, keys the serialized state cache.
+    revision: int = 0
+    _dict_cache: Optional[Tuple[int, Dict[str, Any]]] = field(default=None, repr=False)
+
+    def set_score(self, user_id: uuid.UUID, score: int) -> None:
+        """Sets the score of a user, keeping the leaderboard in step."""
+        self.scores[user_id] = score
+        self.leaderboard.update(user_id, score)
+        self.changed.add(user_id)
+        self.revision += 1
+
+    def remove_score(self, user_id: uuid.UUID) -> bool:
+        """Forgets the score of a user, returns whether they had one."""
+        if self.scores.pop(user_id, None) is None:
+            return False
+
+        self.leaderboard.remove(user_id)
+        if self.move_spaces:
+            self.move_spaces.pop(user_id, None)
+        self.changed.add(user_id)
+        self.revision += 1
+        return True
+
+    def start_round(self) -> None:
+        self.status = GameStatus.ROUND
+        self.round_started = time.time()
+        self.move_spaces = None
+        self.revision += 1
+
+    def finish_round(self) -> None:
+        """Pauses the game, computes how far everyone moves and starts counting the next round from here."""
+        self.status = GameStatus.PAUSED
+        self.move_spaces = self.calculate_move_spaces()
+        self.last_scores = self.scores.copy()
+        self.revision += 1
+
+    def calculate_move_spaces(self) -> Dict[uuid.UUID, int]:
+        """Spaces each user moves for the score gained since `last_scores`."""
+        move_spaces = {}
         max_moves_per_round = 5
 
-        if self.status == GameStatus.PAUSED:
-            move_spaces = {}
+        # Two move algorithms due to skewed distribution of scores with less than 3 players.
+        if len(self.scores) < 3:
+            # Calculate moves based on score of each player seperately.
+            for user_id, score in self.scores.items():
+                if user_id in self.last_scores:
+                    delta_score = score - self.last_scores[user_id]
+                    move_spaces[user_id] = min(max_moves_per_round, (delta_score // 6) + 1) if delta_score > 0 else 0
+                
+                else:
+                    move_spaces[user_id] = min(max_moves_per_round, (score // 6) + 1) if score > 0 else 0
 
-            # Two move algorithms due to skewed distribution of scores with less than 3 players.
-            if len(self.scores) < 3:
-                # Calculate moves based on score of each player seperately.
-                for user_id, score in self.scores.items():
-                    if user_id in self.last_scores:
-                        delta_score = score - self.last_scores[user_id]
-                        move_spaces[user_id] = min(max_moves_per_round, (delta_score // 6) + 1) if delta_score > 0 else 0
-                    
-                    else:
-                        move_spaces[user_id] = min(max_moves_per_round, (score // 6) + 1) if score > 0 else 0
+        else:
+            # Calculate moves based on score of highest players.
+            highest_score = self.leaderboard.highest()
+            for user_id, score in self.scores.items():
+                if user_id in self.last_scores:
+                    delta_score = score - self.last_scores[user_id]
+                    score_proportion = delta_score / highest_score if highest_score > 0 else 0
+                    move_spaces[user_id] = round(max_moves_per_round * score_proportion)
+                else:
+                    score_proportion = score / highest_score if highest_score > 0 else 0
+                    move_spaces[user_id] = round(max_moves_per_round * score_proportion)
 
-            else:
-                # Calculate moves based on score of highest players.
-                max_moves_per_round = 5
-                highest_score = max(self.scores.values()) if self.scores else 0
-                for user_id, score in self.scores.items():
-                    if user_id in self.last_scores:
-                        delta_score = score - self.last_scores[user_id]
-                        score_proportion = delta_score / highest_score if highest_score > 0 else 0
-                        move_spaces[user_id] = round(max_moves_per_round * score_proportion)
-                    else:
-                        score_proportion = score / highest_score if highest_score > 0 else 0
-                        move_spaces[user_id] = round(max_moves_per_round * score_proportion)
+        return move_spaces
 
-            for user_id, score in self.scores.items():
-                self.last_scores[user_id] = score
+    def to_dict(self):
+        """Serializable state, cached until the next change."""
+        if self._dict_cache is not None and self._dict_cache[0] == self.revision:
+            return self._dict_cache[1]
 
-        return {
+        move_spaces = self.move_spaces if self.status == GameStatus.PAUSED else None
+        state = {
             "scores": {str(user_id): score for user_id, score in self.scores.items()}, 
-            "status": self.status, 
+            "status": self.status.value, 
             "move_spaces": {str(user_id): spaces for user_id, spaces in move_spaces.items()} if move_spaces else None
         }
-                
+        self._dict_cache = (self.revision, state)
+        return state
+
+    def top(self, count: int) -> List[Dict[str, Any]]:
+        """The highest scoring users with their rank, best first."""
+        return [
+            {"id": str(user_id), "score": score, "rank": self.leaderboard.rank(user_id)}
+            for user_id, score in self.leaderboard.top(count)
+        ]
+
     def generate_question(self, user_id: uuid.UUID) -> Question:
-        """Generates a new question for the given user."""
-        new_question = Question.generate()
+        """Draws a new question for the given user at their current difficulty."""
+        skill = self.skills.get(user_id)
+        new_question = self.bank.draw(skill.tier if skill else DEFAULT_TIER)
         self.questions[user_id] = new_question
         return new_question
 
@@ -135,11 +232,17 @@ class GameState:
         answer = question.options[answer_idx]
 
         if user_id not in self.scores:
-            self.scores[user_id] = 0
+            self.set_score(user_id, 0)
+
+        skill = self.skills.get(user_id)
+        if skill is None:
+            skill = self.skills[user_id] = Skill()
+        skill.record(answer == question.correct_answer)
 
         if answer == question.correct_answer:
             score = question.calculate_score()
-            self.scores[user_id] += score
+            if score:
+                self.set_score(user_id, self.scores[user_id] + score)
             # Answer is correct
             return True
         else:
@@ -147,62 +250,181 @@ class GameState:
             return False
 
 class Game:
-    """Class managing the game state, user connections and actions within the game."""
-    users: List[User]
-    connections: List[Websocket]
+    """Class managing the game state, user connections and actions within a single room."""
+    __slots__ = (
+        "code", "users", "connections", "current_game", "timer", "round_length", "round_handle", "publisher",
+        "handles", "next_handle", "journal", "resume_grace", "seq", "history",
+        "answer_limiter", "status_listeners", "spectators"
+    )
+
+    code: str
+    users: UserRegistry
+    # Every connection subscribed to the room, including ones that haven't joined as a user.
+    connections: Set[Connection]
     current_game: Optional[GameState]
+    # Seconds left in the current round.
     timer: int
-    timer_task: Optional[asyncio.Task]
-
-    def __init__(self):
-        self.users = []
-        self.connections = []
+    # Duration of a round in seconds.
+    round_length: int
+    round_handle: Optional[Timer]
+    publisher: StatePublisher
+    # Handles of users who joined or still have a score, shared by reference with every connection in the room.
+    handles: Handles
+    next_handle: int
+    # Where state changes are recorded for crash recovery, if enabled.
+    journal: Optional["Journal"]
+    # Seconds a disconnected user is kept around to resume their session, 0 removes them right away.
+    resume_grace: float
+    # Sequence number of the last broadcast.
+    seq: int
+    # Recent broadcasts replayed to resuming clients, as (seq, kind, frames by protocol, encoder).
+    history: Deque[Tuple[int, FrameKind, Dict[Protocol, Frame], Callable[[Protocol], Frame]]]
+    # Answers per second the whole room may submit.
+    answer_limiter: TokenBucket
+    # Called whenever a round starts or ends or the game stops, used by local displays.
+    status_listeners: List[Callable[[], None]]
+    # Connections watching the room without joining it, kept apart from `connections`.
+    spectators: SpectatorStream
+
+    def __init__(
+        self,
+        code: str = "default",
+        state_interval: float = 0.1,
+        round_length: int = 30,
+        resume_grace: float = 30,
+        history_size: int = 256,
+        answer_rate: float = 500,
+        answer_burst: float = 1000,
+        spectator_interval: float = 0.25,
+        spectator_top: int = 10
+    ):
+        self.code = code
+        self.users = UserRegistry()
+        self.connections = set()
         self.timer = 0
+        self.round_length = round_length
         self.current_game = None
-        self.timer_task = None
-
-    async def broadcast_state(self):
-        state = self.current_game.to_dict()
-        for user in self.users:
-            await user.connection.send_json({'action': 'state', 'state': state})
+        self.round_handle = None
+        self.publisher = StatePublisher(self, state_interval)
+        self.handles = {}
+        self.next_handle = 1
+        self.journal = None
+        self.resume_grace = resume_grace
+        self.seq = 0
+        self.history = deque(maxlen=history_size)
+        self.answer_limiter = TokenBucket(answer_rate, answer_burst)
+        self.status_listeners = []
+        self.spectators = SpectatorStream(self, spectator_interval, spectator_top)
+
+    def status_changed(self) -> None:
+        for listener in self.status_listeners:
+            listener()
+
+    def record(self, *entry: Any) -> None:
+        """Writes a state change to the journal if there is one."""
+        if self.journal is not None:
+            self.journal.record(self, entry)
+
+    def record_answer(self, user_id: uuid.UUID, question: Question) -> None:
+        """Journals the outcome of an answer along with the user's next question."""
+        if self.journal is not None:
+            state = self.current_game
+            self.record("answer", str(user_id), state.scores[user_id], astuple(state.skills[user_id]), astuple(question))
+
+    def broadcast(self, message: Any, kind: FrameKind = FrameKind.CRITICAL, connections: Optional[Iterable[Connection]] = None) -> None:
+        """Encodes a message once per protocol and queues the same frame to every user, or to the given connections."""
+        self.broadcast_frames(lambda protocol: protocol.encode(message, self.handles), kind, connections)
+
+    def broadcast_frames(
+        self,
+        encoder: Callable[[Protocol], Frame],
+        kind: FrameKind = FrameKind.CRITICAL,
+        connections: Optional[Iterable[Connection]] = None
+    ) -> None:
+        """Queues a frame to every user, or to the given connections, encoding it at most once per protocol in use."""
+        started = time.perf_counter()
+        if connections is None:
+            connections = (user.connection for user in self.users if user.connection is not None)
+
+        self.seq += 1
+        frames: Dict[Protocol, Frame] = {}
+        # Recipients per protocol, sizes are only measured once per frame.
+        recipients: Dict[Protocol, int] = {}
+        for conn in connections:
+            frame = frames.get(conn.protocol)
+            if frame is None:
+                frame = frames[conn.protocol] = encoder(conn.protocol)
+                recipients[conn.protocol] = 0
+            conn.send(frame, kind, self.seq)
+            recipients[conn.protocol] += 1
+        self.history.append((self.seq, kind, frames, encoder))
+        # Anything players are told changes what spectators see too.
+        self.spectators.mark_dirty()
+
+        metrics.broadcast_seconds.observe(time.perf_counter() - started)
+        metrics.broadcast_bytes.observe(sum(frame_size(frames[protocol]) * count for protocol, count in recipients.items()))
+
+    def start_round_timer(self, elapsed: int = 0) -> None:
+        """Schedules the ticks of a new round on the shared timer wheel, `elapsed` seconds into it."""
+        if self.round_handle is not None:
+            self.round_handle.cancel()
+
+        self.timer = self.round_length - elapsed
+        self.broadcast_timer_update(self.timer)
+
+        # Every tick is scheduled from the round start so late ticks don't push the deadline back.
+        started = time.monotonic() - elapsed
+        self.round_handle = wheel.schedule(started + elapsed + 1, self._round_tick, started, elapsed + 1)
+
+    def resume_round(self) -> None:
+        """Restarts the timer of a round restored from the journal, ending it if it ran out meanwhile."""
+        if self.current_game is None or self.current_game.status != GameStatus.ROUND:
+            return
+
+        elapsed = int(time.time() - self.current_game.round_started)
+        if elapsed < self.round_length:
+            self.start_round_timer(elapsed)
+        else:
+            self.end_round()
 
-    async def round_timer(self):
-        self.timer = 30  # Duration of the round in seconds
-        for remaining in range(self.timer, 0, -1):
-            await asyncio.sleep(1)  # Wait for 1 second
-            if self.current_game is None or self.current_game.status != GameStatus.ROUND:
-                break
+    def _round_tick(self, started: float, elapsed: int) -> None:
+        metrics.timer_drift_seconds.observe(time.monotonic() - started - elapsed)
+        self.round_handle = None
+        if self.current_game is None or self.current_game.status != GameStatus.ROUND:
+            return
 
-            self.timer = remaining
+        # Send an update message with the timer status
+        self.timer = max(0, self.round_length - elapsed)
+        self.broadcast_timer_update(self.timer)
 
-            # Send an update message with the timer status
-            await self.broadcast_timer_update(remaining)
-        
-        # Final score
-        self.timer = 0
-        await self.broadcast_timer_update(0)
+        if self.timer > 0:
+            self.round_handle = wheel.schedule(started + elapsed + 1, self._round_tick, started, elapsed + 1)
+        else:
+            self.end_round()
 
-        if self.current_game is not None and self.current_game.status == GameStatus.ROUND:
-            self.current_game.status = GameStatus.PAUSED
-            await self.broadcast_state()
-            self.current_game.last_scores = self.current_game.scores.copy()
+    def end_round(self) -> None:
+        """Pauses the game and publishes the final scores of the round."""
+        self.current_game.finish_round()
+        self.record("end")
+        self.publisher.flush()
+        self.status_changed()
 
-    async def broadcast_timer_update(self, remaining_time):
-        """Sends an update message with the timer status to all connections."""
+    def broadcast_timer_update(self, remaining_time):
+        """Queues an update message with the timer status to all connections."""
         update = {
             'action': 'timer',
             'time': remaining_time,
         }
 
-        for user in self.users:
-            await user.connection.send_json(update)
+        self.broadcast(update, FrameKind.TIMER)
 
     async def start_game(self) -> ActionResult:
         """Starts the game if there is no current game."""
+        resumed = self.current_game is not None
         if self.current_game:
             if self.current_game.status == GameStatus.PAUSED:
                 # If the game is paused, we prepare to continue.
-                self.current_game.status = GameStatus.ROUND
+                self.current_game.start_round()
             else:
                 # If the game is running and not paused, we raise an error.
                 raise ActionError("Game is already running")
@@ -210,23 +432,25 @@ class Game:
             # If there is no current game, we start a new one.
             self.current_game = GameState()
             self.current_game.start_time = time.time()
-            self.current_game.status = GameStatus.ROUND
-            self.current_game.scores = {user.id: 0 for user in self.users}
+            self.current_game.start_round()
+            for user in self.users:
+                self.current_game.set_score(user.id, 0)
             self.current_game.last_scores = {user.id: 0 for user in self.users}
+        self.record("round", self.current_game.round_started, self.round_length, self.current_game.start_time)
 
         for user in self.users:            
             question = self.current_game.generate_question(user.id)
-            await user.connection.send_json({'action': 'question', 'question': question.to_dict()})
+            self.record("question", str(user.id), astuple(question))
+            if user.connection is not None:
+                user.connection.send_json({'action': 'question', 'question': question.to_dict()})
 
-        # Start or resume the background task to handle the round timer
-        if self.timer_task is not None:
-            self.timer_task.cancel()
+        self.publisher.flush()
 
-        self.timer_task = asyncio.create_task(self.round_timer())
+        # Start or resume the round timer
+        self.start_round_timer()
+        self.status_changed()
 
-        await self.broadcast_state()
-
-        msg = "New round has been started" if not hasattr(self, 'timer_task') else "Game has been resumed"
+        msg = "Game has been resumed" if resumed else "New round has been started"
         return ActionResult(msg, 200)
 
     async def stop_game(self) -> ActionResult:
@@ -235,42 +459,141 @@ class Game:
         if not self.current_game:
             raise ActionError("Game is not running")
         
-        if self.timer_task is not None:
+        if self.round_handle is not None:
+            self.round_handle.cancel()
+            self.round_handle = None
             self.timer = 0
-            self.timer_task.cancel()
-            await self.broadcast_timer_update(0)
+            self.broadcast_timer_update(0)
 
+        self.publisher.reset()
         self.current_game = None
-        for user in self.users:
-            await user.connection.send_json({'action': 'stop'})
+        self.record("stop")
+        self.broadcast({'action': 'stop'})
+        # Scores of users who left are gone with the game, so are their handles.
+        for user_id in self.handles.keys() - {str(user.id) for user in self.users}:
+            del self.handles[user_id]
+        self.status_changed()
         
         return ActionResult("Game has been stopped", 200)
 
-    async def add_user(self, name: str, piece: int, connection: Websocket) -> User:
+    async def add_user(self, name: str, piece: int, connection: Connection) -> User:
         """Adds a new user to the game."""
 
-        user = User(uuid.uuid4(), name, piece, connection)
-        self.users.append(user)
-        await self.broadcast_users_update()
+        user = User(uuid.uuid4(), name, piece, connection, self.next_handle)
+        self.next_handle += 1
+        self.handles[str(user.id)] = user.handle
+        self.users.add(user)
+        self.record("join", str(user.id), name, piece, user.handle, user.token)
+        self.broadcast_users_update()
 
         return user
 
-    async def remove_user(self, connection: Websocket) -> None:
-        """Removes a user from the game based on their connection."""
+    async def remove_user(self, connection: Connection) -> None:
+        """Removes a connection and its user from the game."""
+
+        self.connections.discard(connection)
 
-        user = next((u for u in self.users if u.connection == connection), None)
+        user = self.users.by_connection(connection)
         if user:
-            self.users.remove(user)
-            await self.broadcast_users_update()
-            if self.current_game:
-                self.current_game.scores.pop(user.id, None)
+            self._drop_user(user)
+
+    def _drop_user(self, user: User) -> None:
+        if user.expiry is not None:
+            user.expiry.cancel()
+        self.users.remove(user)
+        self.record("leave", str(user.id))
+        self.broadcast_users_update()
+        if self.current_game is None:
+            self.handles.pop(str(user.id), None)
+        elif self.current_game.remove_score(user.id):
+            # The handle stays valid until the game stops, deltas still name the removed user.
+            self.publisher.mark_dirty()
+
+    def detach_user(self, connection: Connection, on_expire: Callable[[], None]) -> bool:
+        """Keeps the user of a dropped connection for the grace window, returns False if there was none.
+
+        Nothing is broadcast, the user stays listed with their score unless the window runs out.
+        """
+        self.connections.discard(connection)
+
+        user = self.users.by_connection(connection)
+        if user is None:
+            return False
 
-    async def broadcast_users_update(self) -> None:
-        """Sends an updated list of users to all connections."""
+        if self.resume_grace <= 0:
+            self._drop_user(user)
+            on_expire()
+            return True
 
-        users_list = [user.to_dict() for user in self.users]
-        for conn in self.connections:
-            await conn.send_json({'action': 'clients', 'clients': users_list})
+        user.resume_seq = connection.sent_seq
+        self.users.attach(user, None)
+        user.expiry = wheel.call_later(self.resume_grace, self._expire_user, user, on_expire)
+        return True
+
+    def restore_user(self, user_id: uuid.UUID, name: str, piece: int, handle: int, token: str, on_expire: Callable[[], None]) -> User:
+        """Adds a user recovered from the journal, disconnected until they resume."""
+        user = User(user_id, name, piece, None, handle, token)
+        # Everything they got before the restart is gone, resuming rebuilds their state.
+        user.resume_seq = -1
+        user.expiry = wheel.call_later(self.resume_grace, self._expire_user, user, on_expire)
+        self.users.add(user)
+        return user
 
-# Global instance of the game server itself.
-game_instance = Game()
\ No newline at end of file
+    def _expire_user(self, user: User, on_expire: Callable[[], None]) -> None:
+        user.expiry = None
+        if self.users.get(user.id) is user and user.connection is None:
+            self._drop_user(user)
+            on_expire()
+
+    def resume_user(self, token: Any, connection: Connection) -> User:
+        """Reattaches a disconnected user to a new connection."""
+        user = self.users.by_token(token) if isinstance(token, str) else None
+        if user is None:
+            raise ActionError("Session has expired", 404)
+
+        if user.connection is not None:
+            # Old socket hasn't noticed it is dead yet, the new one takes over.
+            previous = user.connection
+            user.resume_seq = previous.sent_seq
+            self.connections.discard(previous)
+            previous.disconnect()
+
+        if user.expiry is not None:
+            user.expiry.cancel()
+            user.expiry = None
+
+        self.users.attach(user, connection)
+        self.connections.add(connection)
+        return user
+
+    def catch_up(self, user: User) -> None:
+        """Sends a resumed user what they missed, replaying recent broadcasts when the history reaches back far enough."""
+        connection = user.connection
+        since = user.resume_seq
+        if since == self.seq or (since >= 0 and self.history and self.history[0][0] <= since + 1):
+            for seq, kind, frames, encoder in self.history:
+                if seq > since:
+                    frame = frames.get(connection.protocol)
+                    if frame is None:
+                        frame = frames[connection.protocol] = encoder(connection.protocol)
+                    connection.send(frame, kind, seq)
+        else:
+            # Missed more than the history holds, rebuild their view from the current state.
+            connection.send_json({'action': 'clients', 'clients': [user.to_dict() for user in self.users]})
+            self.publisher.sync(connection)
+            if self.round_handle is not None:
+                connection.send_json({'action': 'timer', 'time': self.timer}, FrameKind.TIMER)
+
+        state = self.current_game
+        if state is not None and state.status == GameStatus.ROUND:
+            question = state.questions.get(user.id)
+            if question is None:
+                question = state.generate_question(user.id)
+                self.record("question", str(user.id), astuple(question))
+            connection.send_json({'action': 'question', 'question': question.to_dict()})
+
+    def broadcast_users_update(self) -> None:
+        """Queues an updated list of users to all connections."""
+
+        users_list = [user.to_dict() for user in self.users]
+        self.broadcast({'action': 'clients', 'clients': users_list}, connections=self.connections)
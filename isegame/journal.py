@@ -0,0 +1,268 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import astuple
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+import uuid
+
+from .game import Game, GameState, GameStatus
+from .protocol import encode
+from .questions import Question, Skill
+from .rooms import CODE_PATTERN
+from .scheduler import Timer, wheel
+
+logger = logging.getLogger(__name__)
+
+# Journal files are named <room code>.<generation>.journal, snapshots <room code>.snapshot.
+_JOURNAL_FILE = re.compile(rf"^(?P<code>{CODE_PATTERN})\.(?P<generation>\d+)\.journal$")
+
+# A journal entry, the name of the change followed by its arguments.
+Entry = Tuple[Any, ...]
+
+
+class Journal:
+    """Append-only log of every state change of the rooms in this process, for crash recovery.
+
+    Entries are buffered on the loop and written in batches by a single background thread, so the
+    answer path never waits on the disk. Every `snapshot_every` entries a room's full state is
+    snapshotted and its log starts a new generation, so recovery replays at most that many entries
+    on top of the snapshot no matter how long the game ran.
+    """
+
+    def __init__(self, directory: str, flush_interval: float = 0.05, snapshot_every: int = 1000):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.snapshot_every = snapshot_every
+        # Entries not handed to the writer yet, per room code.
+        self.pending: Dict[str, List[Entry]] = {}
+        self.generations: Dict[str, int] = {}
+        # Entries written to the current generation of each room.
+        self.counts: Dict[str, int] = {}
+        self._games: Dict[str, Game] = {}
+        self._flush_handle: Optional[Timer] = None
+        # One thread keeps writes in the order they were submitted.
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="isegame-journal")
+        os.makedirs(directory, exist_ok=True)
+
+    def record(self, game: Game, entry: Entry) -> None:
+        """Buffers an entry, it is written on the next flush."""
+        pending = self.pending.get(game.code)
+        if pending is None:
+            pending = self.pending[game.code] = []
+            self._games[game.code] = game
+        pending.append(entry)
+
+        if self._flush_handle is None:
+            self._flush_handle = wheel.call_later(self.flush_interval, self.flush)
+
+    def flush(self) -> None:
+        """Hands buffered entries to the writer thread, snapshotting rooms with long logs."""
+        self._flush_handle = None
+        pending, self.pending = self.pending, {}
+        games, self._games = self._games, {}
+        for code, entries in pending.items():
+            generation = self.generations.get(code, 0)
+            self._executor.submit(self._append, self._journal_path(code, generation), entries)
+
+            self.counts[code] = self.counts.get(code, 0) + len(entries)
+            if self.counts[code] >= self.snapshot_every:
+                self.snapshot(games[code])
+
+    def snapshot(self, game: Game) -> None:
+        """Captures the full state of a room and starts a new log generation after it."""
+        generation = self.generations.get(game.code, 0) + 1
+        self.generations[game.code] = generation
+        self.counts[game.code] = 0
+        # Captured on the loop so it is consistent, encoded and written by the writer thread.
+        self._executor.submit(self._write_snapshot, game.code, generation, dump(game))
+
+    def drop(self, code: str) -> None:
+        """Forgets a room that was closed, along with its files."""
+        self.pending.pop(code, None)
+        self._games.pop(code, None)
+        self.counts.pop(code, None)
+        self.generations.pop(code, None)
+        self._executor.submit(self._remove, code, None)
+
+    def close(self) -> None:
+        """Writes everything still buffered and waits for the writer to finish."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        self.flush()
+        self._executor.shutdown(wait=True)
+
+    def codes(self) -> List[str]:
+        """Room codes with anything on disk."""
+        codes = set()
+        for name in os.listdir(self.directory):
+            match = _JOURNAL_FILE.match(name)
+            if match:
+                codes.add(match["code"])
+            elif name.endswith(".snapshot"):
+                codes.add(name[:-len(".snapshot")])
+        return sorted(codes)
+
+    def replay(self, game: Game) -> Tuple[int, List[List[Any]]]:
+        """Restores a room from its snapshot and the log written after it.
+
+        Returns the number of entries replayed and the players who were still joined, as
+        `[id, name, piece, handle, token]`.
+
+        Runs before the server starts, so it reads the files directly.
+        """
+        generation = 0
+        # Players joined at each point of the replay, by id.
+        players: Dict[str, List[Any]] = {}
+        try:
+            with open(self._snapshot_path(game.code)) as file:
+                data = json.load(file)
+            generation = data["generation"]
+            load(game, data)
+            players = {player[0]: player for player in data["players"]}
+        except FileNotFoundError:
+            pass
+
+        replayed = 0
+        generations = sorted(
+            int(match["generation"])
+            for match in map(_JOURNAL_FILE.match, os.listdir(self.directory))
+            if match and match["code"] == game.code and int(match["generation"]) >= generation
+        )
+        for log_generation in generations:
+            with open(self._journal_path(game.code, log_generation)) as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn write of the last batch before the crash.
+                        logger.warning("Ignoring a damaged journal entry of room %s", game.code)
+                        break
+                    apply(game, players, entry)
+                    replayed += 1
+
+        self.generations[game.code] = max([generation, *generations])
+        self.counts[game.code] = replayed
+        return replayed, list(players.values())
+
+    def _journal_path(self, code: str, generation: int) -> str:
+        return os.path.join(self.directory, f"{code}.{generation}.journal")
+
+    def _snapshot_path(self, code: str) -> str:
+        return os.path.join(self.directory, f"{code}.snapshot")
+
+    def _append(self, path: str, entries: List[Entry]) -> None:
+        with open(path, "a") as file:
+            file.write("".join(encode(entry) + "\n" for entry in entries))
+            file.flush()
+            os.fsync(file.fileno())
+
+    def _write_snapshot(self, code: str, generation: int, data: Dict[str, Any]) -> None:
+        path = self._snapshot_path(code)
+        with open(path + ".tmp", "w") as file:
+            file.write(encode({**data, "generation": generation}))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + ".tmp", path)
+        # Logs of earlier generations are covered by the snapshot now.
+        self._remove(code, generation)
+
+    def _remove(self, code: str, before: Optional[int]) -> None:
+        """Deletes the logs of a room older than a generation, or every file of it."""
+        for name in os.listdir(self.directory):
+            match = _JOURNAL_FILE.match(name)
+            if match and match["code"] == code and (before is None or int(match["generation"]) < before):
+                os.remove(os.path.join(self.directory, name))
+        if before is None:
+            try:
+                os.remove(self._snapshot_path(code))
+            except FileNotFoundError:
+                pass
+
+def dump(game: Game) -> Dict[str, Any]:
+    """Full state of a room as plain data, sharing nothing mutable with the game."""
+    state = game.current_game
+    return {
+        "round_length": game.round_length,
+        "handles": dict(game.handles),
+        "next_handle": game.next_handle,
+        "players": [[str(user.id), user.name, user.piece, user.handle, user.token] for user in game.users],
+        "state": None if state is None else {
+            "start_time": state.start_time,
+            "round_started": state.round_started,
+            "status": state.status.value,
+            "scores": {str(user_id): score for user_id, score in state.scores.items()},
+            "last_scores": {str(user_id): score for user_id, score in state.last_scores.items()},
+            "move_spaces": {str(user_id): spaces for user_id, spaces in state.move_spaces.items()} if state.move_spaces is not None else None,
+            "questions": {str(user_id): astuple(question) for user_id, question in state.questions.items()},
+            "skills": {str(user_id): astuple(skill) for user_id, skill in state.skills.items()},
+        }
+    }
+
+def load(game: Game, data: Dict[str, Any]) -> None:
+    """Restores a room from `dump` output."""
+    game.round_length = data["round_length"]
+    game.handles.clear()
+    game.handles.update(data["handles"])
+    game.next_handle = data["next_handle"]
+
+    state = data["state"]
+    if state is None:
+        game.current_game = None
+        return
+
+    current = game.current_game = GameState(start_time=state["start_time"], status=GameStatus(state["status"]))
+    current.round_started = state["round_started"]
+    for user_id, score in state["scores"].items():
+        current.set_score(uuid.UUID(user_id), score)
+    current.changed.clear()
+    current.last_scores = {uuid.UUID(user_id): score for user_id, score in state["last_scores"].items()}
+    if state["move_spaces"] is not None:
+        current.move_spaces = {uuid.UUID(user_id): spaces for user_id, spaces in state["move_spaces"].items()}
+    current.questions = {uuid.UUID(user_id): Question(*question) for user_id, question in state["questions"].items()}
+    current.skills = {uuid.UUID(user_id): Skill(*skill) for user_id, skill in state["skills"].items()}
+
+def apply(game: Game, players: Dict[str, List[Any]], entry: List[Any]) -> None:
+    """Replays one journal entry on a room, mirroring what the game did when it was recorded."""
+    action, *args = entry
+    state = game.current_game
+
+    if action == "join":
+        user_id, _name, _piece, handle, _token = args
+        players[user_id] = args
+        game.handles[user_id] = handle
+        game.next_handle = max(game.next_handle, handle + 1)
+    elif action == "leave":
+        user_id, = args
+        players.pop(user_id, None)
+        if state is None:
+            game.handles.pop(user_id, None)
+        else:
+            state.remove_score(uuid.UUID(user_id))
+    elif action == "round":
+        started, round_length, start_time = args
+        game.round_length = round_length
+        if state is None:
+            state = game.current_game = GameState(start_time=start_time)
+            for user_id in players:
+                state.set_score(uuid.UUID(user_id), 0)
+            state.last_scores = {uuid.UUID(user_id): 0 for user_id in players}
+        state.start_round()
+        state.round_started = started
+    elif action == "question":
+        user_id, question = args
+        state.questions[uuid.UUID(user_id)] = Question(*question)
+    elif action == "answer":
+        user_id, score, skill, question = args
+        user_id = uuid.UUID(user_id)
+        if state.scores.get(user_id) != score:
+            state.set_score(user_id, score)
+        state.skills[user_id] = Skill(*skill)
+        state.questions[user_id] = Question(*question)
+    elif action == "end":
+        state.finish_round()
+    elif action == "stop":
+        game.current_game = None
+        for user_id in game.handles.keys() - players.keys():
+            del game.handles[user_id]
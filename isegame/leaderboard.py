@@ -0,0 +1,56 @@
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+import uuid
+
+
+class Leaderboard:
+    """Scores kept sorted highest first for cheap rank lookups and top-K queries.
+
+    Updates are a binary search plus a list insert, which stays far cheaper than re-sorting or
+    scanning every score on each read.
+    """
+    __slots__ = ("_keys", "_scores")
+
+    # (-score, user id) so the natural tuple order puts the highest score first.
+    _keys: List[Tuple[int, uuid.UUID]]
+    _scores: Dict[uuid.UUID, int]
+
+    def __init__(self):
+        self._keys = []
+        self._scores = {}
+
+    def update(self, user_id: uuid.UUID, score: int) -> None:
+        """Sets the score of a user, adding them if needed."""
+        old = self._scores.get(user_id)
+        if old == score:
+            return
+
+        if old is not None:
+            del self._keys[bisect_left(self._keys, (-old, user_id))]
+
+        self._scores[user_id] = score
+        insort(self._keys, (-score, user_id))
+
+    def remove(self, user_id: uuid.UUID) -> None:
+        old = self._scores.pop(user_id, None)
+        if old is not None:
+            del self._keys[bisect_left(self._keys, (-old, user_id))]
+
+    def rank(self, user_id: uuid.UUID) -> Optional[int]:
+        """1-based rank of a user, players with equal scores share a rank."""
+        score = self._scores.get(user_id)
+        if score is None:
+            return None
+
+        # (-score,) sorts before every key with that score, leaving only higher scores to the left.
+        return bisect_left(self._keys, (-score,)) + 1
+
+    def top(self, count: int) -> List[Tuple[uuid.UUID, int]]:
+        """The highest scoring users, best first."""
+        return [(user_id, -score) for score, user_id in self._keys[:count]]
+
+    def highest(self) -> int:
+        return -self._keys[0][0] if self._keys else 0
+
+    def __len__(self) -> int:
+        return len(self._keys)
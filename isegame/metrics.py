@@ -0,0 +1,109 @@
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Small, dependency free metrics exposed in the Prometheus text format on `/metrics`.
+# Recording is a couple of integer/float operations so it can sit on hot paths.
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, values)) + "}"
+
+class Metric:
+    """Base for all metrics, registered on creation so `render` can find them."""
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        registry.append(self)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        return "\n".join([f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()])
+
+class Counter(Metric):
+    """Monotonically increasing count, optionally split by label values."""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help)
+        self.labels = tuple(labels)
+        self.values: Dict[Tuple[str, ...], float] = {} if labels else {(): 0}
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}_total{_format_labels(self.labels, labels)} {_format_value(value)}"
+            for labels, value in self.values.items()
+        ]
+
+class Gauge(Metric):
+    """Value read from a callback at scrape time, costs nothing between scrapes."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, callback: Callable[[], float]):
+        super().__init__(name, help)
+        self.callback = callback
+
+    def samples(self) -> List[str]:
+        return [f"{self.name} {_format_value(self.callback())}"]
+
+class Histogram(Metric):
+    """Distribution of observed values over fixed buckets."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets)
+        # Per bucket counts, the last slot holds values above the highest bound.
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{_format_value(bound)}"}} {cumulative}')
+
+        cumulative += self.counts[-1]
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {cumulative}')
+        lines.append(f"{self.name}_sum {_format_value(self.sum)}")
+        lines.append(f"{self.name}_count {cumulative}")
+        return lines
+
+registry: List[Metric] = []
+
+def render() -> str:
+    """Renders every registered metric in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in registry) + "\n"
+
+
+answers = Counter("isegame_answers", "Answers processed", labels=("result",))
+validate_answer_seconds = Histogram("isegame_validate_answer_seconds", "Time spent validating an answer")
+broadcast_seconds = Histogram("isegame_broadcast_seconds", "Time to encode and queue a broadcast to every recipient")
+broadcast_bytes = Histogram("isegame_broadcast_bytes", "Bytes queued by a single broadcast over all recipients", SIZE_BUCKETS)
+spectator_broadcast_seconds = Histogram("isegame_spectator_broadcast_seconds", "Time to build and queue a spectator frame to every spectator of a room")
+dropped_frames = Counter("isegame_dropped_frames", "Outbound frames discarded by a full send queue")
+overflow_disconnects = Counter("isegame_overflow_disconnects", "Clients disconnected because their send queue was full")
+messages_received = Counter("isegame_messages_received", "Client messages received, including rejected ones")
+rejected_messages = Counter("isegame_rejected_messages", "Client messages dropped before any game work", labels=("reason",))
+timer_drift_seconds = Histogram("isegame_round_timer_drift_seconds", "How late round timer ticks fire relative to their schedule")
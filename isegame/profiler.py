@@ -0,0 +1,102 @@
+import asyncio
+from collections import Counter
+import logging
+import sys
+import threading
+import time
+import traceback
+from types import FrameType
+from typing import Optional
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+loop_lag_seconds = metrics.Histogram("isegame_loop_lag_seconds", "How late the event loop wakes up from a short sleep")
+
+
+class Profiler:
+    """Watches the event loop for stalls while the server runs with `--profile`.
+
+    A task on the loop measures how late it wakes up. A watchdog thread notices when that task stops
+    checking in, and logs the stack of whatever callback is blocking the loop at that moment. With an
+    output path the same thread also samples the loop's stack, and writes it in the collapsed format
+    used by flame graph tools on shutdown.
+    """
+
+    def __init__(self, threshold: float = 0.1, output: Optional[str] = None, interval: float = 0.01):
+        self.threshold = threshold
+        self.output = output
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._last_beat = time.monotonic()
+        self._loop_thread = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Starts monitoring, must be called from the thread running the loop."""
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._measure_lag())
+        self._thread = threading.Thread(target=self._watch, name="isegame-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops monitoring and writes the sampled profile if one was requested."""
+        if self._task is not None:
+            self._task.cancel()
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+        if self.output and self.samples:
+            with open(self.output, "w") as file:
+                for stack, count in self.samples.most_common():
+                    file.write(f"{stack} {count}\n")
+            logger.warning("Wrote %d sampled stacks to %s", len(self.samples), self.output)
+
+    async def _measure_lag(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._last_beat = now
+
+            lag = now - expected
+            loop_lag_seconds.observe(lag)
+            if lag > self.threshold:
+                logger.warning("Event loop lagged %.1f ms", lag * 1000)
+
+    def _watch(self) -> None:
+        reported = False
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+
+            if self.output:
+                self.samples[_collapse(frame)] += 1
+
+            stalled = time.monotonic() - self._last_beat
+            if stalled > self.threshold:
+                # Only report a stall once, the stack is the interesting part and doesn't change much.
+                if not reported:
+                    reported = True
+                    logger.warning(
+                        "Event loop blocked for %.1f ms in:\n%s",
+                        stalled * 1000,
+                        "".join(traceback.format_stack(frame))
+                    )
+            else:
+                reported = False
+
+def _collapse(frame: Optional[FrameType]) -> str:
+    """Formats a stack root first, separated by semicolons."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
@@ -0,0 +1,121 @@
+import json
+from enum import Enum
+from typing import Any, Dict, Iterable, Optional, Union
+import uuid
+
+# orjson is optional, it is several times faster than the stdlib encoder when installed.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# msgpack is optional, the binary protocol is only offered to clients when it is installed.
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Encoded websocket frame, text for JSON and binary for msgpack.
+Frame = Union[str, bytes]
+# Small integer handle of every player in a room keyed by their id, used in place of ids on binary frames.
+Handles = Dict[str, int]
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def encode(message: Any) -> str:
+    """Encodes a message into a text websocket frame."""
+    if orjson is not None:
+        return orjson.dumps(message, default=_default).decode()
+    return json.dumps(message, default=_default, separators=(",", ":"))
+
+def frame_size(frame: Frame) -> int:
+    """Bytes a frame takes on the wire, text frames are sent utf-8 encoded."""
+    if isinstance(frame, bytes) or frame.isascii():
+        return len(frame)
+    return len(frame.encode())
+
+def _compact_keys(values: Optional[Dict[str, Any]], handles: Handles) -> Optional[Dict[Any, Any]]:
+    if not values:
+        return values
+    return {handles.get(user_id, user_id): value for user_id, value in values.items()}
+
+def _compact_state(message: Dict[str, Any], handles: Handles) -> Dict[str, Any]:
+    state = message["state"]
+    return {
+        **message,
+        "state": {
+            **state,
+            "scores": _compact_keys(state["scores"], handles),
+            "move_spaces": _compact_keys(state["move_spaces"], handles),
+        }
+    }
+
+def _compact_delta(message: Dict[str, Any], handles: Handles) -> Dict[str, Any]:
+    return {
+        **message,
+        "scores": _compact_keys(message["scores"], handles),
+        "removed": [handles.get(user_id, user_id) for user_id in message["removed"]],
+    }
+
+def _compact_top(message: Dict[str, Any], handles: Handles) -> Dict[str, Any]:
+    return {**message, "top": [{**entry, "id": handles.get(entry["id"], entry["id"])} for entry in message["top"]]}
+
+# Messages carrying player ids that the binary protocol replaces with handles.
+_COMPACTORS = {
+    "state": _compact_state,
+    "delta": _compact_delta,
+    "top": _compact_top,
+}
+
+class Protocol:
+    """Wire encoding of websocket frames, picked through the websocket subprotocol."""
+    # Subprotocol name clients request, None for the default.
+    subprotocol: Optional[str] = None
+
+    def encode(self, message: Any, handles: Handles) -> Frame:
+        raise NotImplementedError
+
+    def decode(self, data: Frame) -> Any:
+        raise NotImplementedError
+
+class JsonProtocol(Protocol):
+    """Plain JSON text frames, the default and fallback."""
+
+    def encode(self, message: Any, handles: Handles) -> Frame:
+        return encode(message)
+
+    def decode(self, data: Frame) -> Any:
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data)
+
+class MsgpackProtocol(Protocol):
+    """MessagePack binary frames, player ids in scores are sent as small integer handles."""
+    subprotocol = "isegame.msgpack"
+
+    def encode(self, message: Any, handles: Handles) -> Frame:
+        compact = _COMPACTORS.get(message.get("action")) if isinstance(message, dict) else None
+        if compact is not None:
+            message = compact(message, handles)
+        return msgpack.packb(message, default=_default)
+
+    def decode(self, data: Frame) -> Any:
+        if isinstance(data, str):
+            # Text frames are always JSON, whatever was negotiated.
+            return JSON.decode(data)
+        return msgpack.unpackb(data)
+
+JSON = JsonProtocol()
+MSGPACK = MsgpackProtocol() if msgpack is not None else None
+
+def negotiate(requested: Iterable[str]) -> Protocol:
+    """Picks the protocol for a connection from the subprotocols the client offered."""
+    if MSGPACK is not None and MSGPACK.subprotocol in requested:
+        return MSGPACK
+    return JSON
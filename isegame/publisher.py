@@ -0,0 +1,136 @@
+import asyncio
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Tuple
+
+from .connection import Connection, FrameKind
+from .protocol import Frame, Protocol
+
+if TYPE_CHECKING:
+    from .game import Game
+
+
+class StatePublisher:
+    """Publishes the state of a game as a versioned stream of snapshots and deltas.
+
+    Every published frame bumps the version. Snapshots carry the full state and are sent on round
+    events or on request, deltas only carry scores changed since the previous version and are
+    coalesced so at most one goes out per tick. A client seeing a version gap asks for a snapshot.
+
+    Deltas carry absolute scores, so a snapshot of the current state may be labelled with the latest
+    published version even if it already contains changes the next delta will repeat.
+    """
+    __slots__ = ("game", "interval", "dirty", "last_flush", "version", "_frame", "_task")
+
+    game: "Game"
+    interval: float
+    dirty: bool
+    last_flush: float
+    version: int
+    # Snapshot encoder keyed by (version, state revision), reused until either changes.
+    _frame: Optional[Tuple[Tuple[int, int], Callable[[Protocol], Frame]]]
+    _task: Optional[asyncio.Task]
+
+    def __init__(self, game: "Game", interval: float = 0.1):
+        self.game = game
+        self.interval = interval
+        self.dirty = False
+        self.last_flush = 0
+        self.version = 0
+        self._frame = None
+        self._task = None
+
+    def mark_dirty(self) -> None:
+        """Schedules a delta for the next tick."""
+        self.dirty = True
+        if self._task is not None:
+            # A delta is already pending and will include this change.
+            return
+
+        delay = self.last_flush + self.interval - time.monotonic()
+        if delay <= 0:
+            # Nothing was sent during the last tick, no reason to make anyone wait.
+            self.publish_delta()
+        else:
+            self._task = asyncio.create_task(self._publish_later(delay))
+
+    async def _publish_later(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self._task = None
+        self.publish_delta()
+
+    def publish_delta(self) -> None:
+        """Broadcasts scores changed since the last version, if any."""
+        self.cancel()
+        state = self.game.current_game
+        if state is None or not state.changed:
+            return
+
+        scores = {}
+        removed = []
+        for user_id in state.changed:
+            if user_id in state.scores:
+                scores[str(user_id)] = state.scores[user_id]
+            else:
+                removed.append(str(user_id))
+        state.changed.clear()
+
+        self.version += 1
+        self.last_flush = time.monotonic()
+        self.game.broadcast(
+            {'action': 'delta', 'version': self.version, 'scores': scores, 'removed': removed},
+            FrameKind.STATE
+        )
+
+    def flush(self) -> None:
+        """Broadcasts a full snapshot immediately, superseding any pending delta."""
+        self.cancel()
+        state = self.game.current_game
+        if state is None:
+            return
+
+        state.changed.clear()
+        self.version += 1
+        self.last_flush = time.monotonic()
+        self.game.broadcast_frames(self._snapshot_encoder(), FrameKind.STATE)
+
+    def sync(self, connection: Connection) -> None:
+        """Sends a snapshot of the current state to a single connection."""
+        if self.game.current_game is not None:
+            connection.send(self._snapshot_encoder()(connection.protocol))
+
+    def _snapshot_encoder(self) -> Callable[[Protocol], Frame]:
+        """Encoder of a snapshot of the state as it is now, caching its frame per protocol.
+
+        The message is built right away, so encoding it later, as when the room's history is
+        replayed to a resuming client, still yields this version rather than the live state.
+        """
+        state = self.game.current_game
+        key = (self.version, state.revision)
+        if self._frame is not None and self._frame[0] == key:
+            return self._frame[1]
+
+        message = {'action': 'state', 'version': self.version, 'state': state.to_dict()}
+        handles = self.game.handles
+        frames: Dict[Protocol, Frame] = {}
+
+        def encode(protocol: Protocol) -> Frame:
+            frame = frames.get(protocol)
+            if frame is None:
+                frame = frames[protocol] = protocol.encode(message, handles)
+            return frame
+
+        self._frame = (key, encode)
+        return encode
+
+    def cancel(self) -> None:
+        """Drops any pending delta."""
+        self.dirty = False
+        if self._task is not None:
+            if self._task is not asyncio.current_task():
+                self._task.cancel()
+            self._task = None
+
+    def reset(self) -> None:
+        """Forgets the published state once the game it belonged to is gone."""
+        self.cancel()
+        self._frame = None
@@ -0,0 +1,173 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+import random
+import time
+from typing import Deque, Dict, List, NamedTuple, Set, Tuple
+
+# NumPy is optional, batches are generated with vectorized array operations when it is installed.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class Tier(NamedTuple):
+    """Difficulty tier, operands are drawn from [low, high] and combined with one of the operators."""
+    low: int
+    high: int
+    operators: str
+
+# Ordered from easiest to hardest, tier 1 matches the original question generator.
+TIERS: List[Tier] = [
+    Tier(1, 10, "+-"),
+    Tier(1, 10, "+-*"),
+    Tier(1, 20, "+-*"),
+    Tier(5, 50, "+-*"),
+]
+
+DEFAULT_TIER = 1
+
+# Pre-generated question text, shuffled options and correct answer.
+QuestionTemplate = Tuple[str, List[int], int]
+
+
+@dataclass(slots=True)
+class Question:
+    """Represents a question in the game."""
+    question: str
+    options: List[int]
+    correct_answer: int
+    timestamp: float
+
+    def calculate_score(self):
+        # Assumes that the score is higher the quicker the response
+        time_elapsed = time.time() - self.timestamp
+        return max(0, 10 - int(time_elapsed))  # Example scoring formula
+
+    def to_dict(self):
+        return {"question": self.question, "options": self.options}
+
+@dataclass(slots=True)
+class Skill:
+    """Running accuracy of a player, used to move them between difficulty tiers."""
+    tier: int = DEFAULT_TIER
+    # Exponentially weighted share of correct answers.
+    accuracy: float = 0.75
+    # Answers given since the last tier change.
+    answered: int = 0
+
+    def record(self, correct: bool) -> None:
+        self.accuracy += (float(correct) - self.accuracy) * 0.2
+        self.answered += 1
+
+        # Wait for a few answers before judging so a single lucky or unlucky answer doesn't count.
+        if self.answered < 5:
+            return
+
+        if self.accuracy > 0.85 and self.tier < len(TIERS) - 1:
+            self.tier += 1
+        elif self.accuracy < 0.5 and self.tier > 0:
+            self.tier -= 1
+        else:
+            return
+
+        self.accuracy = 0.75
+        self.answered = 0
+
+def _generate_numpy(tier: Tier, size: int) -> List[QuestionTemplate]:
+    rng = np.random.default_rng()
+    num1 = rng.integers(tier.low, tier.high + 1, size)
+    num2 = rng.integers(tier.low, tier.high + 1, size)
+    operation = rng.integers(0, len(tier.operators), size)
+    symbols = np.array(list(tier.operators))[operation]
+
+    answers = np.select(
+        [symbols == "+", symbols == "-"],
+        [num1 + num2, num1 - num2],
+        num1 * num2
+    )
+
+    options = np.stack([
+        answers,
+        answers + rng.integers(1, 5, size),
+        answers - rng.integers(1, 5, size),
+        answers * rng.integers(2, 4, size),
+    ], axis=1)
+    # Shuffle every row independently by sorting random keys.
+    options = np.take_along_axis(options, np.argsort(rng.random(options.shape), axis=1), axis=1)
+
+    return [
+        (f"{a} {op} {b}", opts, answer)
+        for a, op, b, opts, answer in zip(num1.tolist(), symbols.tolist(), num2.tolist(), options.tolist(), answers.tolist())
+    ]
+
+def _generate_python(tier: Tier, size: int) -> List[QuestionTemplate]:
+    batch = []
+    for _ in range(size):
+        num1 = random.randint(tier.low, tier.high)
+        num2 = random.randint(tier.low, tier.high)
+        operation = random.choice(tier.operators)
+        if operation == "+":
+            correct_answer = num1 + num2
+        elif operation == "-":
+            correct_answer = num1 - num2
+        else:
+            correct_answer = num1 * num2
+
+        options = [correct_answer, correct_answer + random.randint(1, 4), correct_answer - random.randint(1, 4), correct_answer * random.randint(2, 3)]
+        random.shuffle(options)
+        batch.append((f"{num1} {operation} {num2}", options, correct_answer))
+
+    return batch
+
+def generate_batch(tier: int, size: int) -> List[QuestionTemplate]:
+    """Generates a batch of questions for a difficulty tier."""
+    if np is not None:
+        return _generate_numpy(TIERS[tier], size)
+    return _generate_python(TIERS[tier], size)
+
+class QuestionBank:
+    """Pools of pre-generated questions per difficulty tier.
+
+    Questions are popped in constant time, pools are topped up in batches from a callback scheduled
+    on the loop once they run low so generation stays off the answer path.
+    """
+    __slots__ = ("batch_size", "pools", "_refilling")
+
+    batch_size: int
+    pools: Dict[int, Deque[QuestionTemplate]]
+    _refilling: Set[int]
+
+    def __init__(self, batch_size: int = 256):
+        self.batch_size = batch_size
+        self.pools = {}
+        self._refilling = set()
+
+    def draw(self, tier: int = DEFAULT_TIER) -> Question:
+        """Takes the next question of a tier."""
+        pool = self.pools.get(tier)
+        if pool is None:
+            pool = self.pools[tier] = deque()
+
+        if not pool:
+            # Cold pool, nothing to do but generate inline.
+            self._refill(tier)
+        elif len(pool) < self.batch_size // 4 and tier not in self._refilling:
+            self._schedule_refill(tier)
+
+        question, options, correct_answer = pool.popleft()
+        return Question(question, options, correct_answer, time.time())
+
+    def _schedule_refill(self, tier: int) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._refill(tier)
+            return
+
+        self._refilling.add(tier)
+        loop.call_soon(self._refill, tier)
+
+    def _refill(self, tier: int) -> None:
+        self._refilling.discard(tier)
+        self.pools[tier].extend(generate_batch(tier, self.batch_size))
@@ -0,0 +1,28 @@
+import time
+
+
+class TokenBucket:
+    """Allows `rate` events per second on average, with bursts of up to `burst` at once."""
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    rate: float
+    burst: float
+    tokens: float
+    updated: float
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, cost: float = 1) -> bool:
+        """Spends tokens for an event, returns False if there aren't enough and it should be dropped."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens < cost:
+            return False
+        self.tokens -= cost
+        return True
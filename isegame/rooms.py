@@ -0,0 +1,158 @@
+import re
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Set
+import uuid
+
+from . import metrics
+from .game import ActionError, Game
+
+if TYPE_CHECKING:
+    from .journal import Journal
+
+# Room used by clients which don't send a room code.
+DEFAULT_ROOM = "default"
+
+MAX_CODE_LENGTH = 32
+# Characters of a normalized room code, ASCII only since codes also name journal files.
+CODE_PATTERN = r"[a-z0-9_-]+"
+_CODE = re.compile(CODE_PATTERN)
+
+
+def normalize_code(code: Optional[str]) -> str:
+    """Validates a room code and returns its canonical form."""
+    if code is None:
+        return DEFAULT_ROOM
+
+    if not isinstance(code, str):
+        raise ActionError("Invalid room code")
+
+    code = code.strip().lower()
+    if len(code) > MAX_CODE_LENGTH or not _CODE.fullmatch(code):
+        raise ActionError("Invalid room code")
+
+    return code
+
+class RoomRegistry:
+    """Creates, looks up and garbage collects independent games keyed by room code."""
+    rooms: Dict[str, Game]
+    pinned: Set[str]
+    max_rooms: int
+    # Minimum seconds between state broadcasts of new rooms.
+    state_interval: float
+    # Default round duration in seconds of new rooms.
+    round_length: int
+    # Seconds disconnected users of new rooms may take to resume their session.
+    resume_grace: float
+    # Answers per second each room accepts, and how many may arrive at once.
+    answer_rate: float
+    answer_burst: float
+    # Minimum seconds between spectator frames of each room, and how many top scores they carry.
+    spectator_interval: float
+    spectator_top: int
+    # Journal of every room's state changes, if crash recovery is enabled.
+    journal: Optional["Journal"]
+
+    def __init__(self, max_rooms: int = 1024, state_interval: float = 0.1, round_length: int = 30, resume_grace: float = 30):
+        self.rooms = {}
+        self.pinned = set()
+        self.max_rooms = max_rooms
+        self.state_interval = state_interval
+        self.round_length = round_length
+        self.resume_grace = resume_grace
+        self.answer_rate = 500
+        self.answer_burst = 1000
+        self.spectator_interval = 0.25
+        self.spectator_top = 10
+        self.journal = None
+
+    def get(self, code: str) -> Optional[Game]:
+        """Returns the game for a room if it exists."""
+        return self.rooms.get(normalize_code(code))
+
+    def get_or_create(self, code: Optional[str]) -> Game:
+        """Returns the game for a room, creating it if needed."""
+        code = normalize_code(code)
+        game = self.rooms.get(code)
+        if game is None:
+            if len(self.rooms) >= self.max_rooms:
+                raise ActionError("Too many rooms are open", 503)
+
+            game = Game(
+                code, self.state_interval, self.round_length, self.resume_grace,
+                answer_rate=self.answer_rate, answer_burst=self.answer_burst,
+                spectator_interval=self.spectator_interval, spectator_top=self.spectator_top
+            )
+            game.journal = self.journal
+            self.rooms[code] = game
+
+        return game
+
+    def pin(self, code: Optional[str]) -> Game:
+        """Returns a room that is never garbage collected, used by local controllers."""
+        game = self.get_or_create(code)
+        self.pinned.add(game.code)
+        return game
+
+    def collect(self, game: Game) -> bool:
+        """Removes a room once nobody is connected to it, returns whether it was removed."""
+        if game.code in self.pinned or game.users or game.connections or game.spectators:
+            return False
+
+        if self.rooms.get(game.code) is not game:
+            return False
+
+        if game.round_handle is not None:
+            game.round_handle.cancel()
+        game.publisher.reset()
+        game.spectators.close()
+        if game.journal is not None:
+            game.journal.drop(game.code)
+
+        del self.rooms[game.code]
+        return True
+
+    def recover(self, owns: Callable[[str], bool]) -> List[Game]:
+        """Restores the rooms found in the journal that this process owns, resuming running rounds."""
+        recovered = []
+        for code in self.journal.codes():
+            if not owns(code) or code in self.rooms:
+                continue
+
+            game = self.get_or_create(code)
+            replayed, players = self.journal.replay(game)
+            # Players come back disconnected, holding on to their score until they resume or the grace window ends.
+            for user_id, name, piece, handle, token in players:
+                game.restore_user(uuid.UUID(user_id), name, piece, handle, token, lambda game=game: self.collect(game))
+            if replayed:
+                # Start the next recovery from here rather than replaying the same log again.
+                self.journal.snapshot(game)
+            game.resume_round()
+            recovered.append(game)
+
+        return recovered
+
+# Global registry of all rooms hosted by this process.
+rooms = RoomRegistry()
+
+metrics.Gauge("isegame_rooms", "Active rooms", lambda: len(rooms.rooms))
+metrics.Gauge("isegame_users", "Users joined to a room", lambda: sum(len(game.users) for game in rooms.rooms.values()))
+metrics.Gauge(
+    "isegame_connections",
+    "Websocket connections subscribed to a room",
+    lambda: sum(len(game.connections) for game in rooms.rooms.values())
+)
+metrics.Gauge(
+    "isegame_spectators",
+    "Connections watching a room without joining it",
+    lambda: sum(len(game.spectators) for game in rooms.rooms.values())
+)
+
+def _queue_depths() -> Iterator[int]:
+    """Outbound queue length of every connection, players and spectators alike."""
+    for game in rooms.rooms.values():
+        for connection in game.connections:
+            yield len(connection.queue)
+        for connection in game.spectators.connections:
+            yield len(connection.queue)
+
+metrics.Gauge("isegame_send_queue_depth_max", "Deepest outbound queue of any connection", lambda: max(_queue_depths(), default=0))
+metrics.Gauge("isegame_send_queue_frames", "Outbound frames queued over all connections", lambda: sum(_queue_depths()))
@@ -1,50 +1,349 @@
-from quart import websocket
+import asyncio
+import hmac
+import ipaddress
+import time
+from typing import Any, Dict, Optional, Union
+from quart import Websocket, jsonify, request, websocket
 
-from isegame.game import ActionError, game_instance, GameStatus
+from isegame import metrics
+from isegame.cluster import PeerSocket, Redirect, cluster
+from isegame.connection import Connection, OverflowPolicy
+from isegame.game import ActionError, ActionResult, Game, GameStatus
+from isegame.protocol import Protocol, negotiate
+from isegame.ratelimit import TokenBucket
+from isegame.rooms import normalize_code, rooms
 from . import app
 
+# Fields every client action must carry and their types, checked before any game work.
+MESSAGE_FIELDS: Dict[str, Dict[str, type]] = {
+    "join": {"name": str, "piece": int},
+    "clients": {},
+    "resume": {"token": str},
+    "spectate": {},
+    "sync": {},
+    "top": {},
+    "answer": {"answer": int},
+}
+
+MAX_NAME_LENGTH = 32
+
+def validate_message(data: Any) -> Dict[str, Any]:
+    """Checks the shape of a decoded client message, raises ActionError if it is malformed."""
+    if not isinstance(data, dict):
+        raise ActionError("Invalid message")
+
+    action = data.get("action")
+    # Lists and dicts aren't hashable, anything but a string can't name an action anyway.
+    fields = MESSAGE_FIELDS.get(action) if isinstance(action, str) else None
+    if fields is None:
+        raise ActionError("Unknown action")
+
+    for name, kind in fields.items():
+        value = data.get(name)
+        # bool is a subclass of int, but not a valid index or piece.
+        if not isinstance(value, kind) or isinstance(value, bool):
+            raise ActionError(f"Invalid {name}")
+
+    if data["action"] == "join" and len(data["name"]) > MAX_NAME_LENGTH:
+        raise ActionError("Name is too long")
+
+    return data
+
+@app.errorhandler(ActionError)
+def handle_action_error(error: ActionError):
+    response = jsonify({"message": error.message})
+    response.status_code = error.status_code
+    return response
+
+async def control_room(action: str, code: str, round_length: Optional[int] = None) -> ActionResult:
+    """Starts or stops the game in a room, forwarding the request to the worker owning it."""
+    code = normalize_code(code)
+    if not cluster.owns(code):
+        try:
+            reply = await cluster.request(code, {"type": "control", "action": action, "code": code, "round_length": round_length})
+        except (OSError, asyncio.IncompleteReadError):
+            # Owner isn't listening yet or went away mid-request.
+            raise ActionError("Room is unavailable", 503)
+        if reply["status_code"] >= 400:
+            raise ActionError(reply["message"], reply["status_code"])
+        return ActionResult(reply["message"], reply["status_code"])
+
+    game = rooms.get(code)
+    if game is None:
+        raise ActionError("Room does not exist", 404)
+
+    if action == "stop":
+        return await game.stop_game()
+
+    if round_length is not None:
+        if not 1 <= round_length <= 3600:
+            raise ActionError("Round length must be between 1 and 3600 seconds")
+        game.round_length = round_length
+
+    return await game.start_game()
+
+def authorize_control() -> None:
+    """Lets operators through: holders of the control token, or clients on this machine when none is set."""
+    token = app.config["CONTROL_TOKEN"]
+    if token is None:
+        try:
+            local = ipaddress.ip_address(request.remote_addr).is_loopback
+        except ValueError:
+            local = False
+        if not local:
+            raise ActionError("Rooms can only be controlled from this machine", 403)
+        return
+
+    supplied = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode()):
+        raise ActionError("Invalid control token", 401)
+
+@app.post('/rooms/<code>/start')
+async def start_room(code: str):
+    """Starts or resumes the game in a room, `?round_length=<seconds>` changes the room's round duration."""
+    authorize_control()
+    result = await control_room("start", code, request.args.get("round_length", type=int))
+    return {"message": result.message}, result.status_code
+
+@app.post('/rooms/<code>/stop')
+async def stop_room(code: str):
+    """Stops the game in a room."""
+    authorize_control()
+    result = await control_room("stop", code)
+    return {"message": result.message}, result.status_code
+
+async def enter_room(connection: Connection, current: Optional[Game], code: Optional[str]) -> Game:
+    """Subscribes a connection to a room's broadcasts, leaving the one it was in before."""
+    game = rooms.get_or_create(code)
+    if current is not None:
+        # Spectators joining as players stop getting the spectator stream.
+        current.spectators.discard(connection)
+    if game is not current:
+        if current is not None:
+            await current.remove_user(connection)
+            rooms.collect(current)
+        connection.handles = game.handles
+
+    game.connections.add(connection)
+
+    return game
+
+async def relay(socket: Websocket, protocol: Protocol, code: str, data: Any) -> Optional[Any]:
+    """Hands a client over to the worker owning its room and pipes frames both ways until either side closes.
+
+    Routing stays with this worker: if the client asks the owner for a room of yet another worker,
+    the owner hands it back and it is relayed there instead, so a client is never more than one hop
+    away. Returns the message naming the room if that room belongs to this worker, None once the
+    client or the owner went away.
+    """
+    async def pump(source: Union[Websocket, PeerSocket], target: Union[Websocket, PeerSocket]) -> None:
+        while True:
+            await target.send(await source.receive())
+
+    while True:
+        try:
+            peer = await cluster.connect(code, {"type": "attach", "subprotocol": protocol.subprotocol})
+        except OSError:
+            # Owner isn't listening yet or died, the client stays here and is told so.
+            raise ActionError("Room is unavailable", 503)
+
+        try:
+            # The message naming the room is replayed so the owner handles it like any other.
+            await peer.send(protocol.encode(data, {}))
+            outbound = asyncio.create_task(pump(socket, peer))
+            inbound = asyncio.create_task(pump(peer, socket))
+            try:
+                await asyncio.wait((outbound, inbound), return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                outbound.cancel()
+                inbound.cancel()
+
+            redirect = inbound.exception() if inbound.done() and not inbound.cancelled() else None
+            if not isinstance(redirect, Redirect):
+                return None
+        finally:
+            peer.close()
+
+        code, data = redirect.code, redirect.message
+        if cluster.owns(code):
+            return data
+
 @app.websocket('/ws')
 async def ws():
     """WebSocket route for handling user connection and actions."""
-    connection = websocket._get_current_object()
-    game_instance.connections.append(connection)
+    # Clients offering the binary subprotocol get it if the server supports it, everyone else speaks JSON.
+    protocol = negotiate(websocket.requested_subprotocols)
+    await websocket.accept(subprotocol=protocol.subprotocol)
+    await handle_client(websocket._get_current_object(), protocol)
+
+async def handle_peer(peer: PeerSocket) -> None:
+    """Serves a stream opened by another worker, either a relayed client or a control request."""
+    header = await peer.receive_json()
+    if header["type"] == "attach":
+        protocol = negotiate([header["subprotocol"]] if header["subprotocol"] else [])
+        await handle_client(peer, protocol)
+    elif header["type"] == "control":
+        try:
+            result = await control_room(header["action"], header["code"], header["round_length"])
+        except ActionError as e:
+            result = ActionResult(e.message, e.status_code)
+        await peer.send_json({"message": result.message, "status_code": result.status_code})
+
+def open_connection(socket: Union[Websocket, PeerSocket], protocol: Protocol) -> Connection:
+    connection = Connection(
+        socket,
+        app.config["SEND_QUEUE_SIZE"],
+        OverflowPolicy(app.config["SEND_QUEUE_POLICY"]),
+        protocol
+    )
+    connection.start()
+    return connection
+
+async def handle_client(socket: Union[Websocket, PeerSocket], protocol: Protocol) -> None:
+    """Runs the actions of a client connected directly or relayed from another worker."""
+    connection = open_connection(socket, protocol)
+    limiter = TokenBucket(app.config["CLIENT_RATE"], app.config["CLIENT_BURST"])
+    # Whether the client was told it is being throttled, only once per episode so floods don't echo back.
+    throttled = False
+    game: Optional[Game] = None
+    # Message of a client relayed away and back, it names a room of this worker and is handled first.
+    returned: Optional[Any] = None
     try:
         user = None
         while True:
+            if returned is None:
+                frame = await socket.receive()
+                metrics.messages_received.inc()
+                # Flooding clients are turned away before their messages are even decoded.
+                if not limiter.take():
+                    metrics.rejected_messages.inc(1, "client_rate")
+                    if not throttled:
+                        throttled = True
+                        connection.send_json({'action': 'error', 'message': 'Too many messages, slow down'})
+                    continue
+                throttled = False
+
+            message, returned = returned, None
             try:
-                data = await websocket.receive_json()
-                if user is not None:
+                try:
+                    data = validate_message(protocol.decode(frame) if message is None else message)
+                except ActionError:
+                    metrics.rejected_messages.inc(1, "invalid")
+                    raise
+                except ValueError:
+                    metrics.rejected_messages.inc(1, "invalid")
+                    raise ActionError("Malformed message")
+
+                if data["action"] == "sync":
+                    # Client missed a state version and needs a full snapshot.
+                    if game is not None:
+                        game.publisher.sync(connection)
+                elif data["action"] == "top":
+                    # Highest scores without a full state, along with the caller's own rank if playing.
+                    if game is not None and game.current_game:
+                        count = data.get("count", 10)
+                        if not isinstance(count, int) or not 1 <= count <= 100:
+                            raise ActionError("Count must be between 1 and 100")
+
+                        connection.send_json({
+                            'action': 'top',
+                            'top': game.current_game.top(count),
+                            'rank': game.current_game.leaderboard.rank(user.id) if user is not None else None
+                        })
+                elif user is not None:
                     # Check correctness of question, send score and new question.
-                    if game_instance.current_game and game_instance.current_game.status == GameStatus.ROUND:
+                    if game.current_game and game.current_game.status == GameStatus.ROUND:
                         if data["action"] == "answer":
-                            correct = game_instance.current_game.validate_answer(user.id, data["answer"])
+                            question = game.current_game.questions.get(user.id)
+                            if question is None or not 0 <= data["answer"] < len(question.options):
+                                metrics.rejected_messages.inc(1, "invalid")
+                                raise ActionError("Invalid answer")
+
+                            # Shared budget so a room full of scripted clients can't monopolize the loop either.
+                            if not game.answer_limiter.take():
+                                metrics.rejected_messages.inc(1, "room_rate")
+                                raise ActionError("Room is busy, try again")
 
-                            # Notify other clients of increased score
+                            started = time.perf_counter()
+                            correct = game.current_game.validate_answer(user.id, data["answer"])
+                            metrics.validate_answer_seconds.observe(time.perf_counter() - started)
+                            metrics.answers.inc(1, "correct" if correct else "incorrect")
+
+                            # Notify other clients of increased score on the next state tick
                             if correct:
-                                await game_instance.broadcast_state()
+                                game.publisher.mark_dirty()
 
-                            question = game_instance.current_game.generate_question(user.id)
-                            await connection.send_json({
+                            question = game.current_game.generate_question(user.id)
+                            game.record_answer(user.id, question)
+                            connection.send_json({
                                 'action': 'answer',
                                 'correct': correct,
                                 'question': question.to_dict()
                             })
                 else:
+                    code = normalize_code(data.get("room")) if data["action"] in ("join", "clients", "resume", "spectate") else None
+                    if code is not None and not cluster.owns(code):
+                        # Room lives in another worker, which takes the client over from here.
+                        if game is not None:
+                            await game.remove_user(connection)
+                            rooms.collect(game)
+                            game = None
+                        connection.close()
+                        if isinstance(socket, PeerSocket):
+                            # Relayed client, the worker it is connected to routes it so hops never chain.
+                            await socket.redirect(code, data)
+                            return
+
+                        try:
+                            returned = await relay(socket, protocol, code, data)
+                        except ActionError:
+                            # Owner is unreachable, keep serving the client here so it gets the error.
+                            connection = open_connection(socket, protocol)
+                            raise
+                        if returned is None:
+                            return
+                        # Client asked for a room of this worker again while relayed.
+                        connection = open_connection(socket, protocol)
+                        continue
+
                     # Join which only happens if the instance is not running.
                     if data["action"] == "join":
-                        if game_instance.current_game:
+                        game = await enter_room(connection, game, data.get("room"))
+                        if game.current_game:
                             raise ActionError("Game is already running")
-                        
-                        if data["piece"] in [u.piece for u in game_instance.users]:
+
+                        if game.users.piece_taken(data["piece"]):
                             raise ActionError("Someone is already using this piece")
 
-                        user = await game_instance.add_user(data["name"], data["piece"], connection)
-                        await connection.send_json({'action': 'identity', 'client': user.to_dict()})
+                        user = await game.add_user(data["name"], data["piece"], connection)
+                        connection.send_json({'action': 'identity', 'client': user.to_dict(), 'token': user.token})
+                    elif data["action"] == "resume":
+                        # Reconnecting client picks its session back up, even mid-game.
+                        game = await enter_room(connection, game, data.get("room"))
+                        user = game.resume_user(data.get("token"), connection)
+                        connection.send_json({'action': 'identity', 'client': user.to_dict(), 'token': user.token})
+                        game.catch_up(user)
                     elif data["action"] == "clients":
-                        # Send clients specifically to the connection.
-                        await connection.send_json({'action': 'clients', 'clients': [user.to_dict() for user in game_instance.users]})
+                        # Send clients of the room specifically to the connection.
+                        game = await enter_room(connection, game, data.get("room"))
+                        connection.send_json({'action': 'clients', 'clients': [user.to_dict() for user in game.users]})
+                    elif data["action"] == "spectate":
+                        # Watches the room through the throttled spectator stream only, never as a user.
+                        spectated = rooms.get_or_create(code)
+                        if game is not None:
+                            game.connections.discard(connection)
+                            game.spectators.discard(connection)
+                            if game is not spectated:
+                                rooms.collect(game)
+                        game = spectated
+                        game.spectators.add(connection)
                     # Other actions...
             except ActionError as e:
-                await connection.send_json({'action': 'error', 'message': e.message})
+                connection.send_json({'action': 'error', 'message': e.message})
     finally:
-        await game_instance.remove_user(connection)
+        connection.close()
+        if game is not None:
+            game.spectators.discard(connection)
+            # Players are held for a while in case they come back, anyone else just leaves.
+            if not game.detach_user(connection, lambda: rooms.collect(game)):
+                rooms.collect(game)
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import math
+import time
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Timer:
+    """Handle of a scheduled callback."""
+    __slots__ = ("deadline", "tick", "callback", "args", "cancelled")
+
+    def __init__(self, deadline: float, tick: int, callback: Callable[..., Any], args: tuple):
+        self.deadline = deadline
+        self.tick = tick
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        """Prevents the callback from running, the entry is dropped when its slot comes up."""
+        self.cancelled = True
+
+class TimerWheel:
+    """Hashed timer wheel shared by every game in the process.
+
+    Timers are bucketed by the tick their absolute monotonic deadline falls in, so scheduling and
+    cancelling are O(1) and a single task drives all of them. Ticks are aligned to a fixed origin,
+    a late wake-up makes the wheel catch up rather than pushing later deadlines back.
+    """
+
+    def __init__(self, resolution: float = 0.05, size: int = 512):
+        self.resolution = resolution
+        self.size = size
+        self.slots: List[List[Timer]] = [[] for _ in range(size)]
+        self.count = 0
+        # Monotonic time of tick 0 and the next tick to process.
+        self.origin = 0.0
+        self.tick = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def schedule(self, deadline: float, callback: Callable[..., Any], *args: Any) -> Timer:
+        """Runs a callback once the monotonic clock reaches the deadline."""
+        if self._task is None or self._task.done():
+            # Wheel was idle, restart the tick count from now.
+            self.origin = time.monotonic()
+            self.tick = 0
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+        tick = max(self.tick, math.ceil((deadline - self.origin) / self.resolution))
+        timer = Timer(deadline, tick, callback, args)
+        self.slots[tick % self.size].append(timer)
+        self.count += 1
+        return timer
+
+    def call_later(self, delay: float, callback: Callable[..., Any], *args: Any) -> Timer:
+        """Runs a callback after a delay in seconds."""
+        return self.schedule(time.monotonic() + delay, callback, *args)
+
+    async def _run(self) -> None:
+        while self.count:
+            delay = self.origin + self.tick * self.resolution - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            current = math.floor((time.monotonic() - self.origin) / self.resolution)
+            first, self.tick = self.tick, current + 1
+            # When far behind every slot is visited once, each fires everything due by now.
+            for tick in range(first, min(current, first + self.size - 1) + 1):
+                self._expire(tick % self.size, current)
+
+    def _expire(self, slot: int, current: int) -> None:
+        pending = self.slots[slot]
+        if not pending:
+            return
+
+        keep = []
+        # Timers added by callbacks land in later ticks, if that is this slot they're visited and kept.
+        for timer in pending:
+            if timer.cancelled:
+                self.count -= 1
+            elif timer.tick <= current:
+                self.count -= 1
+                try:
+                    timer.callback(*timer.args)
+                except Exception:
+                    logger.exception("Timer callback failed")
+            else:
+                keep.append(timer)
+
+        self.slots[slot] = keep
+
+# Global wheel driving every timer in the process.
+wheel = TimerWheel()
@@ -1,13 +1,20 @@
 from sense_hat import SenseHat
 import asyncio
-from .game import game_instance, GameStatus
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+from typing import Awaitable, List, Optional, Tuple
+
+from .game import ActionError, ActionResult, Game, GameStatus
+
+logger = logging.getLogger(__name__)
 
 sense = SenseHat()
 
 white = (255, 255, 255)
 black = (0, 0, 0)
 
-# Define play button (a triangle)isegame
+# Define play button (a triangle)
 play_button = [
     black, black, white, black, black, black, black, black,
     black, black, white, white, black, black, black, black,
@@ -43,26 +50,65 @@ stop_button = [
     black, black, black, black, black, black, black, black
 ]
 
-async def sense_interface():
-    """Returns the Sense Hat interface task."""
-    while True:
-        # Sense matrix display
-        if game_instance.current_game:
-            if game_instance.current_game.status == GameStatus.ROUND:
-                sense.set_pixels(play_button)
-            else:
-                sense.set_pixels(pause_button)
-        else:
-            sense.set_pixels(stop_button)
-
-        # Sense button presses
-        for event in sense.stick.get_events():
-            if event.action != "pressed":
-                continue
-
-            if event.direction == "up" and not game_instance.current_game or game_instance.current_game and game_instance.current_game.status != GameStatus.ROUND:
-                await game_instance.start_game()
-            elif event.direction == "down" and game_instance.current_game:
-                await game_instance.stop_game()
-
-        await asyncio.sleep(1/120)
+class SenseInterface:
+    """Sense HAT display and joystick controlling a room.
+
+    The display is only redrawn when the game status changes, and the blocking framebuffer writes
+    run on a worker thread. The joystick is read by a thread blocking on its events, which hands
+    each press to the loop.
+    """
+
+    def __init__(self, game: Game, loop: asyncio.AbstractEventLoop):
+        self.game = game
+        self.loop = loop
+        self.shown: Optional[List[Tuple[int, int, int]]] = None
+        # One thread keeps writes to the display in order.
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="isegame-sense")
+        self._stick = threading.Thread(target=self._read_stick, name="isegame-stick", daemon=True)
+
+    def start(self) -> None:
+        self.game.status_listeners.append(self.refresh)
+        self.refresh()
+        self._stick.start()
+
+    def screen(self) -> List[Tuple[int, int, int]]:
+        if self.game.current_game:
+            if self.game.current_game.status == GameStatus.ROUND:
+                return play_button
+            return pause_button
+        return stop_button
+
+    def refresh(self) -> None:
+        """Shows the current status if it isn't on the display already."""
+        pixels = self.screen()
+        if pixels is self.shown:
+            return
+
+        self.shown = pixels
+        self.loop.run_in_executor(self._executor, sense.set_pixels, pixels)
+
+    def _read_stick(self) -> None:
+        while True:
+            event = sense.stick.wait_for_event()
+            if event.action == "pressed":
+                self.loop.call_soon_threadsafe(self._pressed, event.direction)
+
+    def _pressed(self, direction: str) -> None:
+        current = self.game.current_game
+        if direction == "up" and (current is None or current.status != GameStatus.ROUND):
+            self.loop.create_task(self._run(self.game.start_game()))
+        elif direction == "down" and current is not None:
+            self.loop.create_task(self._run(self.game.stop_game()))
+
+    async def _run(self, action: Awaitable[ActionResult]) -> None:
+        try:
+            result = await action
+            logger.info(result.message)
+        except ActionError as e:
+            logger.warning(e.message)
+
+def sense_interface(game: Game) -> SenseInterface:
+    """Starts the Sense HAT interface controlling the given room."""
+    interface = SenseInterface(game, asyncio.get_running_loop())
+    interface.start()
+    return interface
@@ -0,0 +1,106 @@
+import argparse
+import os
+import sys
+import tomllib
+from typing import Any, Dict, Mapping, Optional, Sequence
+
+# Environment variables are named after the option, e.g. ISEGAME_STATE_INTERVAL for --state-interval.
+ENV_PREFIX = "ISEGAME_"
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--config", help = "TOML file with settings named like the options, environment variables are ISEGAME_<OPTION>")
+parser.add_argument("--debug", action="store_true", help = "Run in debug mode")
+parser.add_argument("--sense", action="store_true", help = "Run using sense hat as controller")
+parser.add_argument("--room", default="default", help = "Room controlled by the sense hat and debug GUI")
+parser.add_argument("--bind", default="0.0.0.0:3000", help = "Address to listen on as host:port")
+parser.add_argument(
+    "--loop",
+    choices=["auto", "asyncio", "uvloop"],
+    default="auto",
+    help = "Event loop implementation, auto uses uvloop when it is installed"
+)
+parser.add_argument("--keep-alive", type=float, default=5, help = "Seconds an idle HTTP connection is kept open")
+parser.add_argument("--ws-ping-interval", type=float, help = "Seconds between websocket pings, off unless set")
+parser.add_argument("--ws-max-message-size", type=int, default=64 * 1024, help = "Largest websocket message a client may send in bytes")
+parser.add_argument("--access-log", default="-", help = "Access log file, - for stdout or off to disable it")
+parser.add_argument("--access-log-sample", type=float, default=1, help = "Fraction of requests written to the access log")
+parser.add_argument("--access-log-buffer", type=int, default=64, help = "Access log lines buffered before writing, 0 writes each line right away")
+parser.add_argument(
+    "--control-token",
+    help = "Bearer token required to start and stop rooms over HTTP, only local requests may do so without one"
+)
+parser.add_argument("--static-dir", default="isegame_ui/dist", help = "Built UI served at /, loaded in the background after startup")
+parser.add_argument("--openapi", action=argparse.BooleanOptionalAction, default=True, help = "Serve OpenAPI documentation at /docs")
+parser.add_argument("--send-queue-size", type=int, default=64, help = "Maximum queued outbound frames per connection")
+parser.add_argument(
+    "--send-queue-policy",
+    choices=["drop_oldest", "coalesce", "disconnect"],
+    default="coalesce",
+    help = "What to do when a connection's outbound queue is full"
+)
+parser.add_argument("--client-rate", type=float, default=10, help = "Messages per second a single connection may send")
+parser.add_argument("--client-burst", type=int, default=20, help = "Messages a connection may send at once before being limited")
+parser.add_argument("--room-answer-rate", type=float, default=500, help = "Answers per second a room accepts over all its players")
+parser.add_argument("--state-interval", type=int, default=100, help = "Minimum milliseconds between score broadcasts")
+parser.add_argument("--spectator-interval", type=int, default=250, help = "Minimum milliseconds between spectator frames of a room")
+parser.add_argument("--spectator-top", type=int, default=10, help = "Highest scores included in spectator frames")
+parser.add_argument("--round-length", type=int, default=30, help = "Default round duration in seconds")
+parser.add_argument("--resume-grace", type=float, default=30, help = "Seconds a disconnected player may take to resume their session")
+parser.add_argument("--profile", action="store_true", help = "Log event loop stalls along with the stack that caused them")
+parser.add_argument("--profile-threshold", type=int, default=100, help = "Milliseconds the loop may be blocked before it is logged")
+parser.add_argument("--profile-output", help = "Write a sampled profile in collapsed stack format to this file on shutdown")
+parser.add_argument("--journal", help = "Directory to journal game state to, rooms are recovered from it on startup")
+parser.add_argument("--snapshot-every", type=int, default=1000, help = "Journal entries of a room between snapshots of its state")
+parser.add_argument("--workers", type=int, default=1, help = "Worker processes sharing the port, rooms are spread across them")
+
+_TRUE = ("1", "true", "yes", "on")
+_FALSE = ("0", "false", "no", "off")
+
+
+def load_settings(argv: Optional[Sequence[str]] = None, environ: Mapping[str, str] = os.environ) -> argparse.Namespace:
+    """Reads settings from the command line, the environment and a config file, in that order of precedence."""
+    argv = sys.argv[1:] if argv is None else list(argv)
+    actions = {action.dest: action for action in parser._actions if action.dest not in ("help", "config")}
+
+    values: Dict[str, Any] = {}
+    path = parser.parse_known_args(argv)[0].config or environ.get(ENV_PREFIX + "CONFIG")
+    if path:
+        try:
+            with open(path, "rb") as file:
+                data = tomllib.load(file)
+        except (OSError, tomllib.TOMLDecodeError) as e:
+            parser.error(f"cannot read config file {path}: {e}")
+
+        for key, value in data.items():
+            dest = key.replace("-", "_")
+            if dest not in actions:
+                parser.error(f"unknown setting {key} in {path}")
+            values[dest] = _convert(actions[dest], value, key)
+
+    for dest, action in actions.items():
+        name = ENV_PREFIX + dest.upper()
+        if name in environ:
+            values[dest] = _convert(action, environ[name], name)
+
+    # Anything given on the command line overrides these, the rest keeps the option defaults.
+    return parser.parse_args(argv, argparse.Namespace(**values))
+
+def _convert(action: argparse.Action, value: Any, source: str) -> Any:
+    """Converts a value from the environment or config file like argparse would a command line value."""
+    if action.nargs == 0 or isinstance(action, argparse.BooleanOptionalAction):
+        # Flags, given as booleans in the config file or as strings in the environment.
+        if isinstance(value, str) and value.lower() in _TRUE + _FALSE:
+            value = value.lower() in _TRUE
+        if not isinstance(value, bool):
+            parser.error(f"{source} must be true or false")
+        return value
+
+    if isinstance(value, str) and action.type is not None:
+        try:
+            value = action.type(value)
+        except ValueError:
+            parser.error(f"invalid value for {source}: {value!r}")
+
+    if action.choices is not None and value not in action.choices:
+        parser.error(f"{source} must be one of {', '.join(action.choices)}")
+    return value
@@ -0,0 +1,130 @@
+import time
+from typing import TYPE_CHECKING, Any, Dict, Optional, Set
+
+from . import metrics
+from .connection import Connection, FrameKind
+from .protocol import Frame, Protocol
+from .scheduler import Timer, wheel
+
+if TYPE_CHECKING:
+    from .game import Game
+
+
+class SpectatorStream:
+    """Read-only view of a room for audiences that never join it, such as a projector.
+
+    Spectators get a single summary of the room, the top scores and last round's moves, at most
+    once per `interval` however often the room changes. Each frame is built and encoded once per
+    protocol and the same bytes are queued to every spectator, so the cost of a tick doesn't depend
+    on the audience size beyond the queueing. Broadcasts to players only mark the stream dirty.
+    """
+    __slots__ = ("game", "interval", "top_count", "connections", "dirty", "last_flush", "_message", "_frames", "_handle")
+
+    game: "Game"
+    interval: float
+    # Number of highest scores each frame carries.
+    top_count: int
+    connections: Set[Connection]
+    dirty: bool
+    last_flush: float
+    # Latest summary and its encoded frames per protocol, built lazily.
+    _message: Optional[Dict[str, Any]]
+    _frames: Dict[Protocol, Frame]
+    _handle: Optional[Timer]
+
+    def __init__(self, game: "Game", interval: float = 0.25, top_count: int = 10):
+        self.game = game
+        self.interval = interval
+        self.top_count = top_count
+        self.connections = set()
+        self.dirty = False
+        self.last_flush = 0
+        self._message = None
+        self._frames = {}
+        self._handle = None
+
+    def __len__(self) -> int:
+        return len(self.connections)
+
+    def add(self, connection: Connection) -> None:
+        """Subscribes a connection and sends it the latest frame right away."""
+        self.connections.add(connection)
+        connection.send(self._frame(connection.protocol), FrameKind.STATE)
+
+    def discard(self, connection: Connection) -> None:
+        self.connections.discard(connection)
+
+    def mark_dirty(self) -> None:
+        """Schedules a frame for the next tick, called on every change to the room."""
+        if not self.connections:
+            # Nobody is watching, the next spectator gets a fresh frame anyway.
+            self._message = None
+            return
+
+        self.dirty = True
+        if self._handle is None:
+            delay = self.last_flush + self.interval - time.monotonic()
+            self._handle = wheel.call_later(max(delay, 0), self.flush)
+
+    def flush(self) -> None:
+        """Builds one frame of the current state and queues it to every spectator."""
+        self._handle = None
+        if not self.dirty:
+            return
+
+        self.dirty = False
+        self.last_flush = time.monotonic()
+        self._message = None
+        self._frames = {}
+
+        started = time.perf_counter()
+        for connection in self.connections:
+            connection.send(self._frame(connection.protocol), FrameKind.STATE)
+        metrics.spectator_broadcast_seconds.observe(time.perf_counter() - started)
+
+    def _frame(self, protocol: Protocol) -> Frame:
+        if self._message is None:
+            self._message = self._summary()
+            self._frames = {}
+
+        frame = self._frames.get(protocol)
+        if frame is None:
+            frame = self._frames[protocol] = protocol.encode(self._message, {})
+        return frame
+
+    def _summary(self) -> Dict[str, Any]:
+        """Top scores and moves of the room, naming players so spectators need nothing else."""
+        game = self.game
+        state = game.current_game
+        if state is None:
+            return {'action': 'spectate', 'status': None, 'time': game.timer, 'top': [], 'move_spaces': None}
+
+        top = []
+        for user_id, score in state.leaderboard.top(self.top_count):
+            user = game.users.get(user_id)
+            top.append({
+                'name': user.name if user is not None else None,
+                'piece': user.piece if user is not None else None,
+                'score': score,
+                'rank': state.leaderboard.rank(user_id)
+            })
+
+        # Spaces to move by piece, only known between rounds.
+        move_spaces = None
+        if state.move_spaces is not None and state.status.value == "paused":
+            move_spaces = {}
+            for user_id, spaces in state.move_spaces.items():
+                user = game.users.get(user_id)
+                if user is not None:
+                    move_spaces[str(user.piece)] = spaces
+
+        return {'action': 'spectate', 'status': state.status.value, 'time': game.timer, 'top': top, 'move_spaces': move_spaces}
+
+    def close(self) -> None:
+        """Stops ticking once the room is gone."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self.connections.clear()
+        self._message = None
+        self._frames = {}
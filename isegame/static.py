@@ -0,0 +1,112 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from typing import Dict, Optional, Set
+
+from quart import Request, Response
+
+# brotli is optional, assets are only precompressed with gzip without it.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Vite puts a content hash in the names of what it builds into assets/, those never change and may be cached forever.
+# Files copied from public/ keep their names, so only the assets/ directory counts even if a name looks hashed.
+_HASHED_NAME = re.compile(r"assets/.+-[A-Za-z0-9_-]{8,}\.[a-z0-9]+")
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Anything without a hash in its name, index.html in particular, is revalidated through its ETag.
+REVALIDATE = "no-cache"
+
+# Compressing tiny or already compressed files isn't worth a variant.
+_MIN_COMPRESS_SIZE = 256
+_COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml", "application/xml")
+
+
+class Asset:
+    """A file of the built UI held in memory with its compressed variants."""
+    __slots__ = ("body", "variants", "etag", "variant_etags", "content_type", "cache_control")
+
+    body: bytes
+    # Compressed bodies by content encoding, only kept when smaller than the original.
+    variants: Dict[str, bytes]
+    etag: str
+    # Strong validators differ between content codings, each variant has its own ETag.
+    variant_etags: Dict[str, str]
+    content_type: str
+    cache_control: str
+
+    def __init__(self, name: str, body: bytes):
+        self.body = body
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self.content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        self.cache_control = IMMUTABLE if _HASHED_NAME.fullmatch(name) else REVALIDATE
+
+        self.variants = {}
+        self.variant_etags = {}
+        if len(body) >= _MIN_COMPRESS_SIZE and self.content_type.startswith(_COMPRESSIBLE_TYPES):
+            if brotli is not None:
+                self._add_variant("br", brotli.compress(body, quality=11))
+            self._add_variant("gzip", gzip.compress(body, compresslevel=9, mtime=0))
+
+        if self.content_type.startswith("text/") or self.content_type == "application/javascript":
+            self.content_type += "; charset=utf-8"
+
+    def _add_variant(self, encoding: str, body: bytes) -> None:
+        if len(body) < len(self.body):
+            self.variants[encoding] = body
+            self.variant_etags[encoding] = f'{self.etag[:-1]}-{encoding}"'
+
+    def respond(self, request: Request) -> Response:
+        """Builds the response to a request, 304 if the client already has this version."""
+        headers = {"ETag": self.etag, "Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+
+        body = self.body
+        accepted = _accepted_encodings(request.headers.get("Accept-Encoding", ""))
+        # Variants are stored best first.
+        for encoding, compressed in self.variants.items():
+            if encoding in accepted:
+                body = compressed
+                headers["Content-Encoding"] = encoding
+                headers["ETag"] = self.variant_etags[encoding]
+                break
+
+        # Compared against the representation that would be sent.
+        if _matches(request.headers.get("If-None-Match"), headers["ETag"]):
+            return Response(b"", 304, headers)
+
+        return Response(body, 200, headers, content_type=self.content_type)
+
+def _accepted_encodings(header: str) -> Set[str]:
+    accepted = set()
+    for part in header.split(","):
+        encoding, _, params = part.partition(";")
+        if params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(encoding.strip().lower())
+    return accepted
+
+def _matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    # Weak comparison is what If-None-Match asks for.
+    return any(tag.strip() in ("*", etag) or tag.strip() == "W/" + etag for tag in header.split(","))
+
+class StaticAssets:
+    """The built UI loaded into memory and compressed once at startup, so page loads cost no disk or CPU time."""
+
+    def __init__(self, directory: str):
+        self.assets: Dict[str, Asset] = {}
+        for root, _, files in os.walk(directory):
+            for name in files:
+                path = os.path.join(root, name)
+                with open(path, "rb") as file:
+                    body = file.read()
+                # Keyed by the URL path below the UI root.
+                url_path = os.path.relpath(path, directory).replace(os.sep, "/")
+                self.assets[url_path] = Asset(url_path, body)
+
+    def get(self, path: str) -> Optional[Asset]:
+        return self.assets.get(path)
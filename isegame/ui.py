@@ -1,61 +1,158 @@
 import asyncio
+from concurrent.futures import Future
+import logging
+import threading
+import time
 import tkinter as tk
 from tkinter import ttk
-from .game import game_instance, GameStatus
+from typing import Dict, NamedTuple, Optional, Tuple
 
-class DebugGui(tk.Tk):
-    def __init__(self, loop, interval=1/120):
-        super().__init__()
+from . import metrics
+from .game import Game, GameStatus
+
+logger = logging.getLogger(__name__)
+
+
+class View(NamedTuple):
+    """Everything the window shows, sampled on the loop and handed to the Tk thread."""
+    # Row values by user id.
+    rows: Dict[str, Tuple]
+    timer: int
+    status: Optional[GameStatus]
+    connections: int
+    loop_lag_ms: float
+    messages_per_second: float
+    broadcasts_per_second: float
+
+class DebugGui:
+    """Debug window for a room, running Tk in its own thread so it never blocks the loop.
+
+    A task on the loop samples the room at most once per `interval`, and only when the room's
+    broadcast sequence moved or the stats are due. The Tk thread picks up the latest sample and
+    updates just the rows and labels that changed.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, game: Game, shutdown: asyncio.Event, interval: float = 0.1):
         self.loop = loop
+        self.game = game
+        # Stops the server once the window is closed.
+        self.shutdown = shutdown
+        self.interval = interval
+        self._pending: Optional[View] = None
+        self._lock = threading.Lock()
+        self._task = loop.create_task(self._sample())
+        threading.Thread(target=self._run_window, name="isegame-ui", daemon=True).start()
+
+    def publish(self, view: View) -> None:
+        with self._lock:
+            self._pending = view
+
+    def take(self) -> Optional[View]:
+        with self._lock:
+            view, self._pending = self._pending, None
+        return view
+
+    async def _sample(self) -> None:
+        last_seq = -1
+        lag = 0.0
+        stats_started = time.monotonic()
+        received = _total(metrics.messages_received)
+        seq = self.game.seq
+        stats = (0.0, 0.0, 0.0)
+
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(lag, now - expected)
+
+            stats_due = now - stats_started >= 1
+            if stats_due:
+                elapsed = now - stats_started
+                total = _total(metrics.messages_received)
+                stats = (lag * 1000, (total - received) / elapsed, (self.game.seq - seq) / elapsed)
+                received, seq, stats_started, lag = total, self.game.seq, now, 0.0
+
+            if stats_due or self.game.seq != last_seq:
+                last_seq = self.game.seq
+                self.publish(self._view(*stats))
+
+    def _view(self, loop_lag_ms: float, messages_per_second: float, broadcasts_per_second: float) -> View:
+        state = self.game.current_game
+        rows = {
+            str(user.id): (
+                str(user.id), user.name, user.piece,
+                state.scores.get(user.id, 0) if state else 0,
+                "yes" if user.connection is not None else "no"
+            )
+            for user in self.game.users
+        }
+        return View(
+            rows, self.game.timer, state.status if state else None, len(self.game.connections),
+            loop_lag_ms, messages_per_second, broadcasts_per_second
+        )
+
+    def _run_window(self) -> None:
+        window = DebugWindow(self)
+        window.mainloop()
+
+    def start_game(self) -> None:
+        self._submit(self.game.start_game())
+
+    def stop_game(self) -> None:
+        self._submit(self.game.stop_game())
+
+    def _submit(self, action) -> None:
+        # Called from the Tk thread, the game itself is only touched on the loop.
+        future = asyncio.run_coroutine_threadsafe(action, self.loop)
+        future.add_done_callback(_log_failure)
+
+    def close(self) -> None:
+        """Stops sampling and the server with it, called from the Tk thread."""
+        def stop():
+            self._task.cancel()
+            self.shutdown.set()
+        self.loop.call_soon_threadsafe(stop)
+
+def _total(counter: metrics.Counter) -> float:
+    return sum(counter.values.values())
+
+def _log_failure(future: Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning("Debug GUI action failed: %s", getattr(future.exception(), "message", future.exception()))
+
+class DebugWindow(tk.Tk):
+    def __init__(self, gui: DebugGui):
+        super().__init__()
+        self.gui = gui
+        self.rows: Dict[str, Tuple] = {}
+        self.shown: Optional[View] = None
         self.protocol("WM_DELETE_WINDOW", self.close)
-        self.title("IseGame")
-        self.tasks = []
+        self.title(f"IseGame ({gui.game.code})")
 
-        # Creating frame for a clean look 
+        # Creating frame for a clean look
         frame = tk.Frame(self)
         frame.pack(padx=10, pady=10)  # Space around the frame
 
         # Create the Start button
-        self.start_button = tk.Button(
-            frame,
-            text="Start",
-            command=lambda: asyncio.create_task(game_instance.start_game()), 
-            bg="green", fg="white"
-        )
-
+        self.start_button = tk.Button(frame, text="Start", command=gui.start_game, bg="green", fg="white")
         self.start_button.grid(row=0, column=0, padx=5, pady=5)  # Add to the grid
 
         # Create the Stop button
-        self.stop_button = tk.Button(
-            frame,
-            text="Stop",
-            command=lambda: asyncio.create_task(game_instance.stop_game()),
-            bg="red", fg="white"
-        )
-
+        self.stop_button = tk.Button(frame, text="Stop", command=gui.stop_game, bg="red", fg="white")
         self.stop_button.grid(row=0, column=1, padx=5, pady=5)  # Add to the grid
 
-        # Add a label for the timer
-        self.timer_value = tk.StringVar()
-        self.timer_label = tk.Label(frame, textvariable=self.timer_value, font=("Helvetica", 14))
-
-        # Add label next to timer
-        self.timer_text_label = tk.Label(frame, text="Timer: ", font=("Helvetica", 14))
-        self.timer_text_label.grid(row=1, column=0, sticky="w")  # Add to the grid
-        self.timer_label.grid(row=1, column=1, sticky="w")  # Add to the grid
-
-        # Label for the game state
-        self.state_value = tk.StringVar()
-        self.state_label = tk.Label(frame, textvariable=self.state_value, font=("Helvetica", 14))
-
-        # Add label next to state
-        self.state_text_label = tk.Label(frame, text="State: ", font=("Helvetica", 14))
-        self.state_text_label.grid(row=2, column=0, sticky="w")  # Add to the grid
-        self.state_label.grid(row=2, column=1, sticky="w")  # Add to the grid
+        # Labels with their values next to them, in grid order
+        self.values: Dict[str, tk.StringVar] = {}
+        labels = ("Timer", "State", "Connections", "Loop lag", "Messages/s", "Broadcasts/s")
+        for row, label in enumerate(labels, start=1):
+            self.values[label] = tk.StringVar()
+            tk.Label(frame, text=f"{label}: ", font=("Helvetica", 14)).grid(row=row, column=0, sticky="w")
+            tk.Label(frame, textvariable=self.values[label], font=("Helvetica", 14)).grid(row=row, column=1, sticky="w")
 
         tree_frame = tk.Frame(self)
 
-        columns = ('id', 'name', 'piece', 'score')
+        columns = ('id', 'name', 'piece', 'score', 'online')
         self.user_tree = ttk.Treeview(tree_frame, columns=columns, show='headings')
 
         # define headings
@@ -63,45 +160,58 @@ class DebugGui(tk.Tk):
         self.user_tree.heading('name', text='Name')
         self.user_tree.heading('piece', text='Piece')
         self.user_tree.heading('score', text='Score')
+        self.user_tree.heading('online', text='Online')
 
         self.user_tree.pack()
         tree_frame.pack()
 
-        self.tasks.append(loop.create_task(self.updater(interval)))
-
-    async def update_ui(self):
-        self.user_tree.delete(*self.user_tree.get_children())
-        for user in game_instance.users:
-            score = game_instance.current_game.scores[user.id] if game_instance.current_game else 0
-            user = (user.id, user.name, user.piece, score)
-            self.user_tree.insert('', tk.END, values=user)
-
-        self.timer_value.set(game_instance.timer)
-        if game_instance.current_game:
-            self.stop_button.config(state=tk.NORMAL)
-
-            # When round playing start is invalid
-            if game_instance.current_game.status == GameStatus.ROUND:
-                self.state_value.set("Round")
-                self.start_button.config(state=tk.DISABLED)
-            else:
-                self.state_value.set("Paused")
+        self.poll()
+
+    def poll(self) -> None:
+        view = self.gui.take()
+        if view is not None:
+            self.update_ui(view)
+        self.after(int(self.gui.interval * 1000), self.poll)
+
+    def update_ui(self, view: View) -> None:
+        """Applies a sample, touching only the rows and labels that changed."""
+        for user_id in self.rows.keys() - view.rows.keys():
+            self.user_tree.delete(user_id)
+        for user_id, values in view.rows.items():
+            old = self.rows.get(user_id)
+            if old is None:
+                self.user_tree.insert('', tk.END, iid=user_id, values=values)
+            elif old != values:
+                self.user_tree.item(user_id, values=values)
+        self.rows = view.rows
+
+        self.set_value("Timer", view.timer)
+        self.set_value("Connections", view.connections)
+        self.set_value("Loop lag", f"{view.loop_lag_ms:.1f} ms")
+        self.set_value("Messages/s", f"{view.messages_per_second:.1f}")
+        self.set_value("Broadcasts/s", f"{view.broadcasts_per_second:.1f}")
+
+        if self.shown is None or view.status != self.shown.status:
+            if view.status is None:
+                self.set_value("State", "Not Started")
                 self.start_button.config(state=tk.NORMAL)
-        else:
-            self.state_value.set("Not Started")
-            self.start_button.config(state=tk.NORMAL)
-            self.stop_button.config(state=tk.DISABLED)
-        
-
-    async def updater(self, interval):
-        while True:
-            self.update()
-            await self.update_ui()
-            await asyncio.sleep(interval)
-
-    def close(self):
-        for task in self.tasks:
-            task.cancel()
+                self.stop_button.config(state=tk.DISABLED)
+            else:
+                self.stop_button.config(state=tk.NORMAL)
+                # When round playing start is invalid
+                if view.status == GameStatus.ROUND:
+                    self.set_value("State", "Round")
+                    self.start_button.config(state=tk.DISABLED)
+                else:
+                    self.set_value("State", "Paused")
+                    self.start_button.config(state=tk.NORMAL)
+        self.shown = view
+
+    def set_value(self, label: str, value) -> None:
+        value = str(value)
+        if self.values[label].get() != value:
+            self.values[label].set(value)
+
+    def close(self) -> None:
         self.destroy()
-        self.loop.stop()
-        self.loop.close()
+        self.gui.close()
@@ -85,8 +85,6 @@ function App() {
       })
 
       socket.on("timer", ({ time }) => setTimer(time))
-
-      socket.send({ action: "clients" })
     })
   }, [])
 
@@ -244,9 +242,19 @@ const PlayerCard = ({ user }: { user: User }) => {
   )
 }
 
+// Milliseconds the room code has to stay unchanged before the server is asked about it.
+const ROOM_LOOKUP_DELAY = 400
+
 const JoinScreen: React.FC<{ socket: SocketClient, clients: User[] }> = ({ socket, clients }) => {
   const [name, setName] = useState("")
   const [piece, setPiece] = useState(0)
+  const [room, setRoom] = useState(new URLSearchParams(window.location.search).get("room") ?? "default")
+
+  // Show which pieces are taken in the room being joined, once typing pauses so each keystroke doesn't open a room.
+  useEffect(() => {
+    const timeout = setTimeout(() => socket.send({ action: "clients", room: room || undefined }), ROOM_LOOKUP_DELAY)
+    return () => clearTimeout(timeout)
+  }, [socket, room])
 
   return (
     <VStack
@@ -255,6 +263,7 @@ const JoinScreen: React.FC<{ socket: SocketClient, clients: User[] }> = ({ socke
       w="500px"
     >
       <Heading>Join Game</Heading>
+      <Input value={room} placeholder='Room code' onChange={(e) => setRoom(e.target.value)} />
       <Input value={name} placeholder='Your name' onChange={(e) => setName(e.target.value)} />
       <Grid templateColumns='repeat(6, 1fr)' gap={4}>
         {pieceMap.map((option, index) => (
@@ -271,7 +280,7 @@ const JoinScreen: React.FC<{ socket: SocketClient, clients: User[] }> = ({ socke
         ))}
       </Grid>
       <Button w="100%" onClick={() => {
-        socket?.send({ action: "join", name, piece })
+        socket?.send({ action: "join", name, piece, room: room || undefined })
       }}>
         Join
       </Button>
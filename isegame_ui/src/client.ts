@@ -1,7 +1,10 @@
+import { decode, encode } from "./msgpack"
+
 export interface User {
   id: string
   name: string,
   piece: number
+  handle: number // Stands in for the id on binary frames
 }
 
 export interface Question {
@@ -17,9 +20,29 @@ export interface GameState {
   move_spaces?: { [id: string]: number }
 }
 
+export interface RankedScore {
+  id: string
+  score: number
+  rank: number // Players with equal scores share a rank
+}
+
+/**
+ * Scores changed since the previous state version.
+ */
+export interface StateDelta {
+  version: number
+  scores: { [id: string]: number }
+  removed: string[]
+}
+
 type SendSocketMessage =
-  { action: 'join', name: string, piece: number } |
-  { action: 'clients' } |
+  // Room is the code of the game to join, the server uses a shared default room when omitted.
+  { action: 'join', name: string, piece: number, room?: string } |
+  { action: 'clients', room?: string } |
+  // Pick a session back up after reconnecting, token is the one sent with `identity`.
+  { action: 'resume', token: string, room?: string } |
+  { action: 'sync' } | // Request a full state snapshot
+  { action: 'top', count?: number } |
   { action: 'answer', answer: number } // Answer here is the index of the option
 
 /**
@@ -27,16 +50,26 @@ type SendSocketMessage =
  */
 type SocketMessage =
   { action: 'clients', clients: User[] } |
-  { action: 'state', state: GameState } |
-  { action: 'stop' } |
   // The first state call starts the game.
-  { action: 'state', state: GameState } |
+  { action: 'state', version: number, state: GameState } |
+  ({ action: 'delta' } & StateDelta) |
+  { action: 'stop' } |
   { action: 'question', question: Question } |
-  { action: 'identity', client: User } |
+  { action: 'identity', client: User, token: string } |
   { action: 'answer', correct: boolean, question: Question } |
   { action: 'timer', time: number } |
+  { action: 'top', top: RankedScore[], rank: number | null } |
   { action: 'error', message: string }
 
+// Binary protocol the server may pick, JSON is used when it doesn't.
+const MSGPACK_PROTOCOL = "isegame.msgpack"
+
+// Backoff between reconnection attempts in milliseconds.
+const RECONNECT_MIN_DELAY = 250
+const RECONNECT_MAX_DELAY = 5000
+
+type Scores = { [id: string]: number }
+
 /**
  * The client that connects to the server
  */
@@ -44,11 +77,43 @@ export class SocketClient {
   private socket: WebSocket
   private callbacks: { [type: string]: ((message: SocketMessage) => void)[] } = {}
 
-  private constructor(uri: string) {
-    this.socket = new WebSocket(uri)
-    this.socket.addEventListener("message", (event) => {
+  // User ids by handle, binary frames name players by handle and are translated back to ids.
+  private ids: { [handle: string]: string } = {}
+
+  // Latest state and its version, deltas from the server are applied on top of it.
+  private state?: GameState
+  private version = 0
+  private resyncing = false
+
+  // Room last asked for and the session joined in it, resumed whenever the connection drops.
+  private room?: string
+  private session?: { token: string, room?: string }
+  private reconnectDelay = RECONNECT_MIN_DELAY
+
+  private constructor(private uri: string) {
+    this.socket = this.connect()
+  }
+
+  private connect(): WebSocket {
+    const socket = new WebSocket(this.uri, [MSGPACK_PROTOCOL])
+    socket.binaryType = "arraybuffer"
+    socket.addEventListener("message", (event) => {
       this.onMessage(event.data)
     })
+    socket.addEventListener("open", () => {
+      this.reconnectDelay = RECONNECT_MIN_DELAY
+      if (this.session) {
+        // The server replays what was missed while away.
+        this.send({ action: 'resume', ...this.session })
+      }
+    })
+    socket.addEventListener("close", () => {
+      if (this.session) {
+        setTimeout(() => this.socket = this.connect(), this.reconnectDelay)
+        this.reconnectDelay = Math.min(this.reconnectDelay * 2, RECONNECT_MAX_DELAY)
+      }
+    })
+    return socket
   }
 
   public static async createClient(uri: string): Promise<SocketClient> {
@@ -84,14 +149,124 @@ export class SocketClient {
     })
   }
 
-  private onMessage(stringMessage: string) {
-    const message: SocketMessage = JSON.parse(stringMessage)
+  private get binary(): boolean {
+    return this.socket.protocol === MSGPACK_PROTOCOL
+  }
+
+  private decode(data: string | ArrayBuffer): SocketMessage {
+    if (typeof data === "string") {
+      return JSON.parse(data)
+    }
+
+    return this.expandHandles(decode(data) as SocketMessage)
+  }
+
+  private encode(message: SendSocketMessage): string | Uint8Array {
+    return this.binary ? encode(message) : JSON.stringify(message)
+  }
+
+  private id(handle: string | number): string {
+    return this.ids[handle] ?? String(handle)
+  }
+
+  private expandScores<T extends Scores | undefined | null>(scores: T): T {
+    if (!scores) {
+      return scores
+    }
+
+    const expanded: Scores = {}
+    Object.entries(scores).forEach(([handle, score]) => expanded[this.id(handle)] = score)
+    return expanded as T
+  }
+
+  /**
+   * Remember the handles of users and replace handles with user ids so binary messages look like JSON ones.
+   */
+  private expandHandles(message: SocketMessage): SocketMessage {
+    switch (message.action) {
+      case 'clients':
+        message.clients.forEach(user => this.ids[user.handle] = user.id)
+        return message
+      case 'identity':
+        this.ids[message.client.handle] = message.client.id
+        return message
+      case 'state':
+        return {
+          ...message,
+          state: {
+            ...message.state,
+            scores: this.expandScores(message.state.scores),
+            move_spaces: this.expandScores(message.state.move_spaces)
+          }
+        }
+      case 'delta':
+        return { ...message, scores: this.expandScores(message.scores), removed: message.removed.map(handle => this.id(handle)) }
+      case 'top':
+        return { ...message, top: message.top.map(entry => ({ ...entry, id: this.id(entry.id) })) }
+      default:
+        return message
+    }
+  }
+
+  private onMessage(data: string | ArrayBuffer) {
+    const message = this.decode(data)
 
+    if (message.action === 'delta') {
+      const state = this.applyDelta(message)
+      if (state) {
+        this.emit({ action: 'state', version: this.version, state })
+      }
+      return
+    }
+
+    if (message.action === 'state') {
+      this.state = message.state
+      this.version = message.version
+      this.resyncing = false
+    } else if (message.action === 'stop') {
+      this.state = undefined
+      this.resyncing = false
+    } else if (message.action === 'identity') {
+      this.session = { token: message.token, room: this.room }
+    } else if (message.action === 'error' && message.message === 'Session has expired') {
+      this.session = undefined
+    }
+
+    this.emit(message)
+  }
+
+  private emit(message: SocketMessage) {
     if (this.callbacks[message.action]) {
       this.callbacks[message.action].forEach(c => c(message))
     }
   }
 
+  /**
+   * Apply a delta to the current state, requesting a snapshot if a version was missed.
+   * @returns The new state or undefined if the delta could not be applied
+   */
+  private applyDelta(delta: StateDelta): GameState | undefined {
+    if (this.state && delta.version <= this.version) {
+      // Already applied, replays after resuming may repeat a few.
+      return undefined
+    }
+
+    if (!this.state || delta.version !== this.version + 1) {
+      if (!this.resyncing) {
+        this.resyncing = true
+        this.send({ action: 'sync' })
+      }
+      return undefined
+    }
+
+    const scores = { ...this.state.scores, ...delta.scores }
+    delta.removed.forEach(id => delete scores[id])
+
+    this.state = { ...this.state, scores }
+    this.version = delta.version
+    return this.state
+  }
+
   /**
    * Make a method called `on` which accepts a callback of the proper {@link SocketMessage} type with the type provided.
    * @param callback The callback function to be executed when a message of the proper type is received.
@@ -109,13 +284,18 @@ export class SocketClient {
    * @param message The message to send
    */
   public async send<T extends SendSocketMessage['action']>(message: Extract<SendSocketMessage, { action: T }>) {
+    const sent = message as SendSocketMessage
+    if (sent.action === 'join' || sent.action === 'clients') {
+      this.room = sent.room
+    }
+
     if (this.socket.readyState !== this.socket.OPEN) {
       try {
         await this.waitForOpenConnection()
-        this.socket.send(JSON.stringify(message))
+        this.socket.send(this.encode(message))
       } catch (err) { console.error(err) }
     } else {
-      this.socket.send(JSON.stringify(message))
+      this.socket.send(this.encode(message))
     }
   }
 }
\ No newline at end of file
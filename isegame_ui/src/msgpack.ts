@@ -0,0 +1,216 @@
+/**
+ * Minimal MessagePack codec covering the types the game protocol uses:
+ * nil, booleans, integers, floats, strings, arrays and maps.
+ */
+
+const textEncoder = new TextEncoder()
+const textDecoder = new TextDecoder()
+
+class Writer {
+  private buffer = new Uint8Array(64)
+  private view = new DataView(this.buffer.buffer)
+  private length = 0
+
+  private reserve(size: number) {
+    if (this.length + size <= this.buffer.length) {
+      return
+    }
+
+    const grown = new Uint8Array(Math.max(this.buffer.length * 2, this.length + size))
+    grown.set(this.buffer)
+    this.buffer = grown
+    this.view = new DataView(grown.buffer)
+  }
+
+  public byte(value: number) {
+    this.reserve(1)
+    this.buffer[this.length++] = value
+  }
+
+  public uint16(value: number) {
+    this.reserve(2)
+    this.view.setUint16(this.length, value)
+    this.length += 2
+  }
+
+  public uint32(value: number) {
+    this.reserve(4)
+    this.view.setUint32(this.length, value)
+    this.length += 4
+  }
+
+  public int32(value: number) {
+    this.reserve(4)
+    this.view.setInt32(this.length, value)
+    this.length += 4
+  }
+
+  public float64(value: number) {
+    this.reserve(8)
+    this.view.setFloat64(this.length, value)
+    this.length += 8
+  }
+
+  public bytes(value: Uint8Array) {
+    this.reserve(value.length)
+    this.buffer.set(value, this.length)
+    this.length += value.length
+  }
+
+  public result(): Uint8Array {
+    return this.buffer.slice(0, this.length)
+  }
+}
+
+function writeLength(writer: Writer, length: number, fix: number, fixMax: number, codes: [number, number, number]) {
+  if (length <= fixMax) {
+    writer.byte(fix | length)
+  } else if (length < 0x100 && codes[0] !== 0) {
+    writer.byte(codes[0])
+    writer.byte(length)
+  } else if (length < 0x10000) {
+    writer.byte(codes[1])
+    writer.uint16(length)
+  } else {
+    writer.byte(codes[2])
+    writer.uint32(length)
+  }
+}
+
+function writeValue(writer: Writer, value: unknown) {
+  if (value === null || value === undefined) {
+    writer.byte(0xc0)
+  } else if (typeof value === "boolean") {
+    writer.byte(value ? 0xc3 : 0xc2)
+  } else if (typeof value === "number") {
+    if (Number.isInteger(value) && value >= -0x80000000 && value <= 0xffffffff) {
+      if (value >= 0 && value < 0x80) {
+        writer.byte(value)
+      } else if (value < 0 && value >= -0x20) {
+        writer.byte(value & 0xff)
+      } else if (value > 0) {
+        writer.byte(0xce)
+        writer.uint32(value)
+      } else {
+        writer.byte(0xd2)
+        writer.int32(value)
+      }
+    } else {
+      writer.byte(0xcb)
+      writer.float64(value)
+    }
+  } else if (typeof value === "string") {
+    const encoded = textEncoder.encode(value)
+    writeLength(writer, encoded.length, 0xa0, 31, [0xd9, 0xda, 0xdb])
+    writer.bytes(encoded)
+  } else if (Array.isArray(value)) {
+    writeLength(writer, value.length, 0x90, 15, [0, 0xdc, 0xdd])
+    value.forEach(item => writeValue(writer, item))
+  } else if (typeof value === "object") {
+    const entries = Object.entries(value as object).filter(([, item]) => item !== undefined)
+    writeLength(writer, entries.length, 0x80, 15, [0, 0xde, 0xdf])
+    entries.forEach(([key, item]) => {
+      writeValue(writer, key)
+      writeValue(writer, item)
+    })
+  } else {
+    throw new Error(`Cannot encode ${typeof value} as MessagePack`)
+  }
+}
+
+export function encode(value: unknown): Uint8Array {
+  const writer = new Writer()
+  writeValue(writer, value)
+  return writer.result()
+}
+
+class Reader {
+  private view: DataView
+  private offset = 0
+
+  constructor(private buffer: Uint8Array) {
+    this.view = new DataView(buffer.buffer, buffer.byteOffset, buffer.byteLength)
+  }
+
+  public value(): unknown {
+    const code = this.view.getUint8(this.offset++)
+
+    if (code < 0x80) return code
+    if (code < 0x90) return this.map(code & 0x0f)
+    if (code < 0xa0) return this.array(code & 0x0f)
+    if (code < 0xc0) return this.string(code & 0x1f)
+    if (code >= 0xe0) return code - 0x100
+
+    switch (code) {
+      case 0xc0: return null
+      case 0xc2: return false
+      case 0xc3: return true
+      case 0xc4: return this.binary(this.uint(1))
+      case 0xc5: return this.binary(this.uint(2))
+      case 0xc6: return this.binary(this.uint(4))
+      case 0xca: return this.read(4, () => this.view.getFloat32(this.offset))
+      case 0xcb: return this.read(8, () => this.view.getFloat64(this.offset))
+      case 0xcc: return this.uint(1)
+      case 0xcd: return this.uint(2)
+      case 0xce: return this.uint(4)
+      case 0xcf: return this.read(8, () => Number(this.view.getBigUint64(this.offset)))
+      case 0xd0: return this.read(1, () => this.view.getInt8(this.offset))
+      case 0xd1: return this.read(2, () => this.view.getInt16(this.offset))
+      case 0xd2: return this.read(4, () => this.view.getInt32(this.offset))
+      case 0xd3: return this.read(8, () => Number(this.view.getBigInt64(this.offset)))
+      case 0xd9: return this.string(this.uint(1))
+      case 0xda: return this.string(this.uint(2))
+      case 0xdb: return this.string(this.uint(4))
+      case 0xdc: return this.array(this.uint(2))
+      case 0xdd: return this.array(this.uint(4))
+      case 0xde: return this.map(this.uint(2))
+      case 0xdf: return this.map(this.uint(4))
+    }
+
+    throw new Error(`Unsupported MessagePack type 0x${code.toString(16)}`)
+  }
+
+  private read<T>(size: number, get: () => T): T {
+    const value = get()
+    this.offset += size
+    return value
+  }
+
+  private uint(size: 1 | 2 | 4): number {
+    switch (size) {
+      case 1: return this.read(1, () => this.view.getUint8(this.offset))
+      case 2: return this.read(2, () => this.view.getUint16(this.offset))
+      case 4: return this.read(4, () => this.view.getUint32(this.offset))
+    }
+  }
+
+  private binary(length: number): Uint8Array {
+    return this.read(length, () => this.buffer.slice(this.offset, this.offset + length))
+  }
+
+  private string(length: number): string {
+    return textDecoder.decode(this.binary(length))
+  }
+
+  private array(length: number): unknown[] {
+    const items = []
+    for (let i = 0; i < length; i++) {
+      items.push(this.value())
+    }
+    return items
+  }
+
+  // Keys come back as strings since that is all a plain object can hold, integer handles included.
+  private map(length: number): { [key: string]: unknown } {
+    const result: { [key: string]: unknown } = {}
+    for (let i = 0; i < length; i++) {
+      const key = this.value()
+      result[String(key)] = this.value()
+    }
+    return result
+  }
+}
+
+export function decode(data: ArrayBuffer | Uint8Array): unknown {
+  return new Reader(data instanceof Uint8Array ? data : new Uint8Array(data)).value()
+}